@@ -1,123 +1,2518 @@
+import argparse
+import asyncio
+import bisect
 import boto3
+import botocore.session
 import csv
+import heapq
+import ipaddress
 import json
 import logging
-from botocore.exceptions import ClientError
+import os
+import queue
+import random
+import shelve
+import signal
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
+from botocore.exceptions import BotoCoreError, ClientError, ConnectionError as EndpointError, HTTPClientError
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
+class DeadlineExceeded(Exception):
+    """Raised by StorageGatewayManager calls made after its deadline has passed."""
+
+class TokenBucket:
+    """Blocking token bucket whose refill rate can be changed while in use."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes one token, sleeping until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = (1 - self.tokens) / self.rate
+            time.sleep(wait_for)
+
+class AdaptiveRateLimiter:
+    """
+    Per-operation token buckets with AIMD rate control. Each success raises
+    an operation's rate by `increase` requests/second; each throttle cuts it
+    by `decrease`. Throttles, 5xx responses and connection errors are
+    retried with full-jitter exponential backoff, so clients wrapped by the
+    limiter should have botocore retries off (ClientFactory does this with
+    max_attempts=0). Counters are exposed through stats(); EffectiveRate is
+    measured over the last `window` seconds.
+    """
+
+    THROTTLE_CODES = {'ThrottlingException', 'Throttling', 'TooManyRequestsException',
+                      'RequestLimitExceeded', 'SlowDown'}
+
+    def __init__(self, initial_rate=5.0, min_rate=0.5, max_rate=50.0, increase=0.5, decrease=0.5,
+                 max_retries=8, base_delay=0.2, max_delay=20.0, window=60.0):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.window = window
+        self.started = time.monotonic()
+        self._buckets = {}
+        self._counters = {}
+        self._recent = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, operation):
+        with self._lock:
+            if operation not in self._buckets:
+                self._buckets[operation] = TokenBucket(self.initial_rate)
+                self._counters[operation] = {'Calls': 0, 'Throttles': 0, 'Retries': 0}
+                self._recent[operation] = deque()
+            return self._buckets[operation]
+
+    def _adjust(self, operation, throttled):
+        """Additive increase on success, multiplicative decrease on throttle."""
+        bucket = self._bucket(operation)
+        with self._lock:
+            if throttled:
+                self._counters[operation]['Throttles'] += 1
+                bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+            else:
+                bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+
+    @classmethod
+    def is_throttle(cls, error):
+        return error.response.get('Error', {}).get('Code') in cls.THROTTLE_CODES
+
+    @staticmethod
+    def is_transient(error):
+        """Server-side or connection failures that are worth retrying without slowing down."""
+        if isinstance(error, ClientError):
+            return error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+        return isinstance(error, (EndpointError, HTTPClientError))
+
+    def call(self, operation, func, deadline=None, **kwargs):
+        """
+        Calls func(**kwargs) under the operation's rate, retrying throttles and
+        transient errors. If a retry can't start before deadline (a
+        time.monotonic() value), DeadlineExceeded is raised instead.
+        """
+        bucket = self._bucket(operation)
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            with self._lock:
+                self._counters[operation]['Calls'] += 1
+                self._recent[operation].append(time.monotonic())
+            try:
+                response = func(**kwargs)
+            except (ClientError, BotoCoreError) as e:
+                throttled = isinstance(e, ClientError) and self.is_throttle(e)
+                if not throttled and not self.is_transient(e):
+                    raise
+                if throttled:
+                    self._adjust(operation, throttled=True)
+                if attempt == self.max_retries:
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                if deadline is not None and time.monotonic() + delay > deadline:
+                    raise DeadlineExceeded(f"Deadline passed while retrying {operation}") from e
+                with self._lock:
+                    self._counters[operation]['Retries'] += 1
+                time.sleep(delay)
+                continue
+            self._adjust(operation, throttled=False)
+            return response
+
+    def stats(self):
+        """Returns per-operation call/throttle/retry counts and rates."""
+        now = time.monotonic()
+        span = max(min(now - self.started, self.window), 1e-9)
+        with self._lock:
+            for recent in self._recent.values():
+                while recent and recent[0] < now - self.window:
+                    recent.popleft()
+            return {
+                operation: dict(counters,
+                                Rate=round(self._buckets[operation].rate, 3),
+                                EffectiveRate=round(len(self._recent[operation]) / span, 3))
+                for operation, counters in self._counters.items()
+            }
+
+class MemoryCacheBackend:
+    """In-process LRU store for ResponseCache entries."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def items(self):
+        with self._lock:
+            return list(self._entries.items())
+
+class DiskCacheBackend:
+    """shelve-backed store so cached responses survive between runs."""
+
+    def __init__(self, path='.sgw_cache'):
+        self._db = shelve.open(path)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._db.get(key)
+
+    def set(self, key, entry):
+        with self._lock:
+            self._db[key] = entry
+            self._db.sync()
+
+    def delete(self, key):
+        with self._lock:
+            self._db.pop(key, None)
+
+    def items(self):
+        with self._lock:
+            return list(self._db.items())
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class ResponseCache:
+    """
+    TTL cache in front of read-only API calls, with stale-while-revalidate:
+    within ttl an entry is served as-is; for stale_ttl seconds after that it
+    is still served immediately while one background refresh replaces it.
+    Entries are tagged with every gateway ARN in the request or response so
+    invalidate_gateway() can drop them.
+    """
+
+    DEFAULT_TTLS = {
+        'describe_gateway_information': 60,
+        'list_file_shares': 300,
+        'describe_nfs_file_shares': 300,
+        'describe_smb_file_shares': 300,
+        'list_volumes': 300,
+        'describe_cached_iscsi_volumes': 300,
+        'describe_stored_iscsi_volumes': 300,
+        'list_file_system_associations': 300,
+        'describe_file_system_associations': 300,
+        'describe_cache': 300
+    }
+
+    def __init__(self, backend=None, ttls=None, stale_ttl=600, refresh_workers=4):
+        self.backend = backend or MemoryCacheBackend()
+        self.ttls = dict(self.DEFAULT_TTLS, **(ttls or {}))
+        self.stale_ttl = stale_ttl
+        self.hits = self.stale_hits = self.misses = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers)
+
+    @staticmethod
+    def make_key(scope, operation, kwargs):
+        return json.dumps([scope, operation, kwargs], sort_keys=True, default=str)
+
+    @staticmethod
+    def _gateway_tags(kwargs, response):
+        """Collects every GatewayARN mentioned in the request or response."""
+        tags = set()
+        def walk(value):
+            if isinstance(value, dict):
+                for k, v in value.items():
+                    if k == 'GatewayARN' and isinstance(v, str):
+                        tags.add(v)
+                    else:
+                        walk(v)
+            elif isinstance(value, list):
+                for v in value:
+                    walk(v)
+        walk(kwargs)
+        walk(response)
+        return tags
+
+    def _store(self, key, kwargs, response):
+        self.backend.set(key, (time.time(), response, self._gateway_tags(kwargs, response)))
+
+    def _refresh(self, key, kwargs, fetch):
+        try:
+            self._store(key, kwargs, fetch())
+        except Exception as e:
+            logging.warning(f"Background cache refresh failed, keeping stale entry: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_or_fetch(self, scope, operation, kwargs, fetch):
+        """Returns a cached response for the call, fetching or revalidating as needed."""
+        ttl = self.ttls.get(operation)
+        if ttl is None:
+            return fetch()
+        key = self.make_key(scope, operation, kwargs)
+        entry = self.backend.get(key)
+        if entry is not None:
+            age = time.time() - entry[0]
+            if age < ttl:
+                self.hits += 1
+                return entry[1]
+            if age < ttl + self.stale_ttl:
+                self.stale_hits += 1
+                with self._lock:
+                    start_refresh = key not in self._refreshing
+                    self._refreshing.add(key)
+                if start_refresh:
+                    self._refresher.submit(self._refresh, key, kwargs, fetch)
+                return entry[1]
+        self.misses += 1
+        response = fetch()
+        self._store(key, kwargs, response)
+        return response
+
+    def invalidate_gateway(self, gateway_arn):
+        """Drops every entry tagged with gateway_arn. Returns how many were removed."""
+        stale = [key for key, entry in self.backend.items() if gateway_arn in entry[2]]
+        for key in stale:
+            self.backend.delete(key)
+        return len(stale)
+
+    def invalidate_all(self):
+        for key, _ in self.backend.items():
+            self.backend.delete(key)
+
+class ClientFactory:
+    """
+    Thread-safe cache of boto3 clients keyed by (service, account, region, role).
+    Building a client costs tens of milliseconds plus endpoint resolution, so
+    every manager asks the factory instead of calling boto3.client directly.
+    All clients share one tuned botocore Config. Clients whose calls go
+    through an AdaptiveRateLimiter are built with max_attempts=0 (no botocore
+    retries), so the limiter sees every throttle and retries are not stacked.
+    """
+
+    def __init__(self, max_pool_connections=50, tcp_keepalive=True, connect_timeout=10,
+                 read_timeout=60, retry_mode='standard', max_attempts=5):
+        self.max_pool_connections = max_pool_connections
+        self.tcp_keepalive = tcp_keepalive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retry_mode = retry_mode
+        self.max_attempts = max_attempts
+        self._clients = {}
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def config(self, max_pool_connections=None, max_attempts=None):
+        """Returns the botocore Config used for every client this factory builds."""
+        return Config(
+            max_pool_connections=max(self.max_pool_connections, max_pool_connections or 0),
+            tcp_keepalive=self.tcp_keepalive,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            retries={'mode': self.retry_mode, 'max_attempts': self.max_attempts if max_attempts is None else max_attempts}
+        )
+
+    def get_client(self, service, region_name, session=None, account=None, role=None,
+                   max_pool_connections=None, max_attempts=None):
+        """
+        Returns the cached client for this key, creating it on first use. The
+        pool size is fixed when the client is created, so pass the largest
+        worker count you expect as max_pool_connections on the first call.
+        max_attempts overrides the botocore retry count (and is part of the key).
+        """
+        key = (service, account, region_name, role, max_attempts)
+        with self._lock:
+            # boto3 sessions are not thread-safe, so creation happens under the lock too
+            if key not in self._clients:
+                self._clients[key] = (session or boto3).client(
+                    service, region_name=region_name, config=self.config(max_pool_connections, max_attempts))
+            return self._clients[key]
+
+    def get_limiter(self, account, region_name):
+        """
+        Returns the rate limiter shared by every manager for this account and
+        region, which is the scope AWS applies its API rate limits to.
+        """
+        with self._lock:
+            return self._limiters.setdefault((account, region_name), AdaptiveRateLimiter())
+
+    def clear(self):
+        """Drops every cached client and limiter."""
+        with self._lock:
+            self._clients.clear()
+            self._limiters.clear()
+
+client_factory = ClientFactory()
+
 class StorageGatewayManager:
-    def __init__(self, region_name='us-east-1'):
-        self.client = boto3.client('storagegateway', region_name=region_name)
+    VOLUME_GATEWAY_TYPES = ['CACHED', 'STORED']
+    VOLUME_BATCH_SIZE = 10
+    TAPE_BATCH_SIZE = 50
+
+    def __init__(self, region_name='us-east-1', max_workers=1, session=None, account=None, role=None,
+                 factory=None, cache=None, deadline=None):
+        # Size the connection pool to the worker count so threads don't queue on sockets
+        self.client = (factory or client_factory).get_client(
+            'storagegateway', region_name, session=session, account=account, role=role,
+            max_pool_connections=max_workers, max_attempts=0)
+        self.limiter = (factory or client_factory).get_limiter(account, region_name)
+        self.cache = cache
+        self.deadline = deadline
+        self.account = account
         self.region = region_name
+        self.max_workers = max_workers
+        self.error_count = 0
+        self._error_lock = threading.Lock()
+
+    def _note_error(self):
+        """Counts a failed API call so callers can report partial results."""
+        with self._error_lock:
+            self.error_count += 1
+
+    def _call(self, operation, cached=True, **kwargs):
+        """
+        Makes one API call through the response cache (if any) and the rate
+        limiter. cached=False skips the cache for callers that need a live answer.
+        """
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise DeadlineExceeded(f"Deadline passed before {operation}")
+        fetch = lambda: self.limiter.call(operation, getattr(self.client, operation), deadline=self.deadline,
+                                          **kwargs)
+        if self.cache is None or not cached:
+            return fetch()
+        return self.cache.get_or_fetch((self.account, self.region), operation, kwargs, fetch)
+
+    def invalidate_gateway(self, gateway_arn):
+        """Forgets cached responses for one gateway, e.g. after changing its shares."""
+        if self.cache is not None:
+            self.cache.invalidate_gateway(gateway_arn)
+
+    def _iter_pages(self, operation, cached=True, **kwargs):
+        """Yields each page of a Marker-paginated operation, one rate-limited call per page."""
+        api_name = self.client.meta.method_to_api_mapping[operation]
+        output_shape = self.client.meta.service_model.operation_model(api_name).output_shape
+        # Some list calls echo the input Marker and return the next one as NextMarker
+        next_key = 'NextMarker' if 'NextMarker' in output_shape.members else 'Marker'
+        marker = None
+        while True:
+            params = dict(kwargs, Marker=marker) if marker else kwargs
+            page = self._call(operation, cached=cached, **params)
+            yield page
+            marker = page.get(next_key)
+            if not marker:
+                return
+
+    def _paginate(self, operation, key, cached=True, **kwargs):
+        """Collects every item under key across all pages of operation."""
+        items = []
+        for page in self._iter_pages(operation, cached=cached, **kwargs):
+            items.extend(page.get(key, []))
+        return items
 
     def list_all_gateways(self):
         """Retrieves all gateway ARNs using a paginator."""
         try:
-            gateways = []
-            paginator = self.client.get_paginator('list_gateways')
-            for page in paginator.paginate():
-                gateways.extend(page.get('Gateways', []))
-            return gateways
+            return self._paginate('list_gateways', 'Gateways')
         except ClientError as e:
+            self._note_error()
             logging.error(f"Failed to list gateways: {e}")
             return []
 
-    def get_detailed_status(self):
-        """Returns high-level metadata for all gateways in the account."""
-        gateways = self.list_all_gateways()
-        detailed_list = []
-        for gw in gateways:
+    def _map(self, func, items, max_workers=None):
+        """Yields func(item) for each item in order, on a thread pool when workers > 1."""
+        items = list(items)
+        workers = min(max_workers or self.max_workers, len(items))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                yield from pool.map(func, items)
+        else:
+            for item in items:
+                yield func(item)
+
+    def _describe_gateway(self, gateway_arn, extra_fields=()):
+        """Describes a single gateway, returning None if the call fails."""
+        try:
+            info = self._call('describe_gateway_information', GatewayARN=gateway_arn)
+            record = {
+                'Name': info.get('GatewayName', 'N/A'),
+                'ID': info.get('GatewayId', 'N/A'),
+                'Status': info.get('GatewayState', 'UNKNOWN'),
+                'Type': info.get('GatewayType', 'N/A'),
+                'ARN': gateway_arn
+            }
+            for field in extra_fields:
+                record[field] = info.get(field)
+            return record
+        except ClientError as e:
+            self._note_error()
+            logging.warning(f"Could not describe gateway {gateway_arn}: {e}")
+            return None
+
+    @staticmethod
+    def _shallow_record(gw):
+        """Builds a status record from a list_gateways entry without any describe call."""
+        return {
+            'Name': gw.get('GatewayName', 'N/A'),
+            'ID': gw.get('GatewayId', 'N/A'),
+            'Status': gw.get('GatewayOperationalState', 'UNKNOWN'),
+            'Type': gw.get('GatewayType', 'N/A'),
+            'ARN': gw['GatewayARN']
+        }
+
+    def get_detailed_status(self, max_workers=None, shallow=False, extra_fields=None):
+        """
+        Returns high-level metadata for all gateways in the account.
+        With more than one worker the describe calls run on a bounded
+        thread pool; results are always returned in ARN order.
+
+        In shallow mode the records are built straight from list_gateways
+        (Status is the operational state, e.g. ACTIVE). Extra fields that
+        list_gateways also returns (SoftwareVersion, HostEnvironment,
+        Ec2InstanceId, DeprecationDate, ...) are taken from the listing, and
+        gateways are only described for extras the listing cannot provide.
+        """
+        gateways = sorted(self.list_all_gateways(), key=lambda gw: gw['GatewayARN'])
+        extra_fields = tuple(extra_fields or ())
+        if shallow:
+            listed_fields = self.client.meta.service_model.shape_for('GatewayInfo').members
+            records = []
+            for gw in gateways:
+                record = self._shallow_record(gw)
+                record.update((field, gw.get(field)) for field in extra_fields if field in listed_fields)
+                records.append(record)
+            describe_fields = tuple(field for field in extra_fields if field not in listed_fields)
+            if describe_fields:
+                described = self._map(lambda gw: self._describe_gateway(gw['GatewayARN'], describe_fields),
+                                      gateways, max_workers)
+                for record, info in zip(records, described):
+                    record.update((field, info[field] if info else None) for field in describe_fields)
+            return records
+
+        arns = [gw['GatewayARN'] for gw in gateways]
+        results = self._map(lambda arn: self._describe_gateway(arn, extra_fields), arns, max_workers)
+        return [r for r in results if r is not None]
+
+    def _describe_share_batch(self, batch, share_type, cached=True):
+        """Describes up to 10 shares of one type in a single call."""
+        try:
+            if share_type == 'NFS':
+                response = self._call('describe_nfs_file_shares', cached=cached, FileShareARNList=batch)
+                return response.get('NFSFileShareInfoList', [])
+            response = self._call('describe_smb_file_shares', cached=cached, FileShareARNList=batch)
+            return response.get('SMBFileShareInfoList', [])
+        except ClientError as e:
+            self._note_error()
+            logging.error(f"Failed to describe {share_type} shares: {e}")
+            return []
+
+    def _iter_share_batches(self, share_arns, share_type, cached=True):
+        """Yields the described shares one batch at a time, in input order."""
+        # AWS limits describe calls to 10 ARNs at a time
+        batches = [share_arns[i:i+10] for i in range(0, len(share_arns), 10)]
+        yield from self._map(lambda batch: self._describe_share_batch(batch, share_type, cached), batches)
+
+    def _get_share_details(self, share_arns, share_type, cached=True):
+        """Batches and fetches deep details for specific shares (NFS or SMB)."""
+        details = []
+        for batch in self._iter_share_batches(share_arns, share_type, cached):
+            details.extend(batch)
+        return details
+
+    def _list_gateway_shares(self, gateway_arn, cached=True):
+        """Lists the basic share info for one gateway."""
+        return self._paginate('list_file_shares', 'FileShareInfoList', cached=cached, GatewayARN=gateway_arn)
+
+    def _list_shares_by_gateway(self, gateways, cached=True):
+        """Maps gateway ARN to its share listing, skipping gateways that fail to list."""
+        def list_one(gw):
             try:
-                info = self.client.describe_gateway_information(GatewayARN=gw['GatewayARN'])
-                detailed_list.append({
-                    'Name': info.get('GatewayName', 'N/A'),
-                    'ID': info.get('GatewayId', 'N/A'),
-                    'Status': info.get('GatewayState', 'UNKNOWN'),
-                    'Type': info.get('GatewayType', 'N/A'),
-                    'ARN': gw['GatewayARN']
-                })
+                return self._list_gateway_shares(gw['ARN'], cached=cached)
+            except ClientError as e:
+                self._note_error()
+                logging.error(f"Error gathering share data for {gw['Name']}: {e}")
+                return None
+
+        listings = {}
+        for gw, shares_info in zip(gateways, self._map(list_one, gateways)):
+            if shares_info is not None:
+                listings[gw['ARN']] = shares_info
+        return listings
+
+    @staticmethod
+    def _format_share(share, share_type):
+        """Flattens a describe_*_file_shares entry into a report record."""
+        if share_type == 'NFS':
+            return {
+                'ShareID': share.get('FileShareId'),
+                'Type': 'NFS',
+                'Path': share.get('Path'),
+                'Bucket': share.get('LocationARN'),
+                'AllowedClients': share.get('ClientList', []), # IP Ranges
+                'Status': share.get('FileShareStatus')
+            }
+        return {
+            'ShareID': share.get('FileShareId'),
+            'Type': 'SMB',
+            'Path': share.get('Path'),
+            'Bucket': share.get('LocationARN'),
+            'AD_AllowedUsers': share.get('ValidUserList', []),
+            'AD_AllowedGroups': [u for u in share.get('ValidUserList', []) if u.startswith('@')],
+            'AD_AdminUsers': share.get('AdminUserList', []),
+            'Status': share.get('FileShareStatus'),
+            'SMB_ACL_Enabled': share.get('SMBACLEnabled', False)
+        }
+
+    @staticmethod
+    def _pool_share_arns(listings):
+        """Groups the share ARNs from every gateway listing by share type."""
+        share_arns = {'NFS': [], 'SMB': []}
+        for shares_info in listings.values():
+            for s in shares_info:
+                if s['FileShareType'] in share_arns:
+                    share_arns[s['FileShareType']].append(s['FileShareARN'])
+        logging.info(f"Describing {len(share_arns['NFS'])} NFS and {len(share_arns['SMB'])} SMB "
+                     f"shares across {len(listings)} gateways...")
+        return share_arns
+
+    def iter_share_batches(self, file_gateways):
+        """
+        Lists shares on file_gateways, then yields one list of
+        (gateway record, share type, raw share) tuples per describe batch as
+        soon as that batch returns. Only the share ARNs are held in memory.
+        """
+        listings = self._list_shares_by_gateway(file_gateways)
+        owners = {gw['ARN']: gw for gw in file_gateways}
+        share_owner = {s['FileShareARN']: owners[gw_arn]
+                       for gw_arn, shares_info in listings.items() for s in shares_info}
+        for share_type, arns in self._pool_share_arns(listings).items():
+            for batch in self._iter_share_batches(arns, share_type):
+                yield [(share_owner[share['FileShareARN']], share_type, share) for share in batch]
+
+    def collect_share_report(self, gateways=None):
+        """
+        Builds the per-gateway share report. Share ARNs are collected from
+        every gateway first and described in full batches of 10 per type,
+        so many small gateways share describe calls instead of each paying
+        for its own.
+        """
+        if gateways is None:
+            gateways = self.get_detailed_status()
+        file_gateways = [gw for gw in gateways if gw['Type'] in ['FILE_S3', 'FILE_FSX_SMB']]
+        listings = self._list_shares_by_gateway(file_gateways)
+
+        # 1. Pool share ARNs from all gateways by type
+        share_arns = self._pool_share_arns(listings)
+
+        # 2. Describe in globally packed batches, keyed by share ARN
+        described = {}
+        for share_type, arns in share_arns.items():
+            for share in self._get_share_details(arns, share_type):
+                described[share['FileShareARN']] = self._format_share(share, share_type)
+
+        # 3. Map the results back to their gateways (NFS first, then SMB)
+        return self._assemble_report(file_gateways, listings, described)
+
+    @staticmethod
+    def _assemble_report(file_gateways, listings, described):
+        """Builds {gateway name: {GatewayID, Shares}} from listings and {share ARN: record}."""
+        share_report = {}
+        for gw in file_gateways:
+            if gw['ARN'] not in listings:
+                continue
+            shares_info = listings[gw['ARN']]
+            full_details = []
+            for share_type in ('NFS', 'SMB'):
+                full_details.extend(described[s['FileShareARN']] for s in shares_info
+                                    if s['FileShareType'] == share_type and s['FileShareARN'] in described)
+            share_report[gw['Name']] = {
+                'GatewayID': gw['ID'],
+                'Shares': full_details
+            }
+        return share_report
+
+    def _list_gateway_volumes(self, gateway_arn):
+        """Lists the basic volume info for one gateway."""
+        return self._paginate('list_volumes', 'VolumeInfos', GatewayARN=gateway_arn)
+
+    def _describe_volume_batch(self, batch, volume_type):
+        """Describes up to 10 cached or stored iSCSI volumes from one gateway in a single call."""
+        if volume_type == 'CACHED':
+            response = self._call('describe_cached_iscsi_volumes', VolumeARNs=batch)
+            return response.get('CachediSCSIVolumes', [])
+        response = self._call('describe_stored_iscsi_volumes', VolumeARNs=batch)
+        return response.get('StorediSCSIVolumes', [])
+
+    @staticmethod
+    def _format_volume(volume, volume_type):
+        """Flattens a describe_*_iscsi_volumes entry into a report record."""
+        iscsi = volume.get('VolumeiSCSIAttributes', {})
+        record = {
+            'VolumeID': volume.get('VolumeId'),
+            'Type': volume_type,
+            'Status': volume.get('VolumeStatus'),
+            'AttachmentStatus': volume.get('VolumeAttachmentStatus'),
+            'SizeBytes': volume.get('VolumeSizeInBytes'),
+            'UsedBytes': volume.get('VolumeUsedInBytes'),
+            'TargetARN': iscsi.get('TargetARN'),
+            'TargetName': volume.get('TargetName'),
+            'NetworkInterfaceId': iscsi.get('NetworkInterfaceId'),
+            'SourceSnapshotId': volume.get('SourceSnapshotId'),
+            'CreatedDate': str(volume['CreatedDate']) if volume.get('CreatedDate') else None
+        }
+        if volume_type == 'STORED':
+            record['DiskId'] = volume.get('VolumeDiskId')
+            record['PreservedExistingData'] = volume.get('PreservedExistingData', False)
+        return record
+
+    def _gateway_volumes(self, gw):
+        """Lists and describes every volume on one volume gateway, or None if listing fails."""
+        try:
+            arns = [v['VolumeARN'] for v in self._list_gateway_volumes(gw['ARN'])]
+        except ClientError as e:
+            self._note_error()
+            logging.error(f"Error gathering volume data for {gw['Name']}: {e}")
+            return None
+        volumes = []
+        # The describe calls only accept volumes from a single gateway, so batches stay per gateway
+        for i in range(0, len(arns), self.VOLUME_BATCH_SIZE):
+            try:
+                batch = self._describe_volume_batch(arns[i:i+self.VOLUME_BATCH_SIZE], gw['Type'])
+                volumes.extend(self._format_volume(v, gw['Type']) for v in batch)
             except ClientError as e:
-                logging.warning(f"Could not describe gateway {gw['GatewayARN']}: {e}")
-        return detailed_list
+                self._note_error()
+                logging.error(f"Failed to describe {gw['Type']} volumes on {gw['Name']}: {e}")
+        return volumes
+
+    def iter_volume_reports(self, gateways):
+        """Yields (gateway record, volume records) for each CACHED/STORED gateway, describing gateways concurrently."""
+        volume_gateways = [gw for gw in gateways if gw['Type'] in self.VOLUME_GATEWAY_TYPES]
+        for gw, volumes in zip(volume_gateways, self._map(self._gateway_volumes, volume_gateways)):
+            if volumes is not None:
+                yield gw, volumes
+
+    def collect_volume_report(self, gateways=None):
+        """Builds {gateway name: {GatewayID, Volumes}} for the volume gateways."""
+        if gateways is None:
+            gateways = self.get_detailed_status()
+        return {gw['Name']: {'GatewayID': gw['ID'], 'Volumes': volumes}
+                for gw, volumes in self.iter_volume_reports(gateways)}
+
+    @staticmethod
+    def _format_tape(tape, archived=False):
+        """Flattens a describe_tapes / describe_tape_archives entry into a report record."""
+        record = {
+            'TapeARN': tape.get('TapeARN'),
+            'Barcode': tape.get('TapeBarcode'),
+            'Status': tape.get('TapeStatus'),
+            'SizeBytes': tape.get('TapeSizeInBytes'),
+            'UsedBytes': tape.get('TapeUsedInBytes'),
+            'PoolId': tape.get('PoolId'),
+            'Worm': tape.get('Worm', False),
+            'Archived': archived
+        }
+        if archived:
+            record['CompletionTime'] = str(tape['CompletionTime']) if tape.get('CompletionTime') else None
+            record['RetrievedTo'] = tape.get('RetrievedTo')
+        else:
+            record['VTLDevice'] = tape.get('VTLDevice')
+            record['Progress'] = tape.get('Progress')
+        return record
+
+    def _describe_tape_batch(self, gateway_arn, batch):
+        """Describes up to TAPE_BATCH_SIZE tapes from one gateway."""
+        try:
+            return self._call('describe_tapes', GatewayARN=gateway_arn, TapeARNs=batch).get('Tapes', [])
+        except ClientError as e:
+            self._note_error()
+            logging.error(f"Failed to describe tapes on {gateway_arn}: {e}")
+            return []
+
+    def iter_tape_records(self, gateways=None, include_archive=True):
+        """
+        Streams tape records without holding the tape set in memory. Each
+        list_tapes page is grouped by gateway and described in batches,
+        concurrently on the worker pool; archived (VTS) tapes then follow
+        page by page from describe_tape_archives.
+        """
+        if gateways is None:
+            gateways = self.get_detailed_status(shallow=True)
+        names = {gw['ARN']: (gw['Name'], gw['ID']) for gw in gateways}
+        try:
+            for page in self._iter_pages('list_tapes'):
+                by_gateway = {}
+                for t in page.get('TapeInfos', []):
+                    if t.get('GatewayARN'):
+                        by_gateway.setdefault(t['GatewayARN'], []).append(t['TapeARN'])
+                batches = [(gw_arn, arns[i:i+self.TAPE_BATCH_SIZE])
+                           for gw_arn, arns in by_gateway.items()
+                           for i in range(0, len(arns), self.TAPE_BATCH_SIZE)]
+                described = self._map(lambda b: (b[0], self._describe_tape_batch(*b)), batches)
+                for gw_arn, tapes in described:
+                    name, gw_id = names.get(gw_arn, ('N/A', 'N/A'))
+                    for tape in tapes:
+                        yield {'Gateway': name, 'GatewayID': gw_id, **self._format_tape(tape)}
+        except ClientError as e:
+            self._note_error()
+            logging.error(f"Failed to list tapes: {e}")
+
+        if include_archive:
+            try:
+                for page in self._iter_pages('describe_tape_archives'):
+                    for tape in page.get('TapeArchives', []):
+                        yield {'Gateway': None, 'GatewayID': None, **self._format_tape(tape, archived=True)}
+            except ClientError as e:
+                self._note_error()
+                logging.error(f"Failed to describe tape archives: {e}")
+
+    def export_tapes_to_ndjson(self, filename='gateway_tapes.ndjson', gateways=None, include_archive=True):
+        """Streams every virtual tape (and, optionally, archived tape) as one JSON line each."""
+        count = 0
+        with open(filename, 'w') as f:
+            for record in self.iter_tape_records(gateways, include_archive):
+                f.write(json.dumps(record) + '\n')
+                count += 1
+                if count % 1000 == 0:
+                    f.flush()
+        logging.info(f"Streamed {count} tapes to {filename}")
+
+    def _list_gateway_associations(self, gw):
+        """Lists FSx file system association summaries for one gateway, or None if listing fails."""
+        try:
+            return self._paginate('list_file_system_associations', 'FileSystemAssociationSummaryList',
+                                  GatewayARN=gw['ARN'])
+        except ClientError as e:
+            self._note_error()
+            logging.error(f"Error gathering file system associations for {gw['Name']}: {e}")
+            return None
+
+    def _describe_association_batch(self, batch):
+        """Describes up to 10 file system associations in a single call."""
+        try:
+            response = self._call('describe_file_system_associations', FileSystemAssociationARNList=batch)
+            return response.get('FileSystemAssociationInfoList', [])
+        except ClientError as e:
+            self._note_error()
+            logging.error(f"Failed to describe file system associations: {e}")
+            return []
+
+    @staticmethod
+    def _format_association(assoc):
+        """Flattens a describe_file_system_associations entry into a report record."""
+        return {
+            'AssociationID': assoc.get('FileSystemAssociationARN', '').rsplit('/', 1)[-1] or None,
+            'Type': 'FSX_SMB',
+            'FileSystem': assoc.get('LocationARN'),
+            'Status': assoc.get('FileSystemAssociationStatus'),
+            'AuditDestination': assoc.get('AuditDestinationARN'),
+            'CacheStaleTimeoutSeconds': assoc.get('CacheAttributes', {}).get('CacheStaleTimeoutInSeconds'),
+            'IpAddresses': assoc.get('EndpointNetworkConfiguration', {}).get('IpAddresses', [])
+        }
+
+    def iter_association_batches(self, fsx_gateways):
+        """
+        Lists associations on every FSx gateway concurrently, then yields one
+        list of (gateway record, association record) per describe batch.
+        Batches of 10 ARNs are packed across gateways, like shares.
+        """
+        owners = {}
+        for gw, summaries in zip(fsx_gateways, self._map(self._list_gateway_associations, fsx_gateways)):
+            for a in summaries or []:
+                owners[a['FileSystemAssociationARN']] = gw
+        arns = list(owners)
+        batches = [arns[i:i+10] for i in range(0, len(arns), 10)]
+        for batch in self._map(self._describe_association_batch, batches):
+            yield [(owners[a['FileSystemAssociationARN']], self._format_association(a)) for a in batch]
+
+    def collect_association_report(self, gateways=None):
+        """Builds {gateway name: {GatewayID, FileSystemAssociations}} for FILE_FSX_SMB gateways."""
+        if gateways is None:
+            gateways = self.get_detailed_status()
+        fsx_gateways = [gw for gw in gateways if gw['Type'] == 'FILE_FSX_SMB']
+        report = {gw['Name']: {'GatewayID': gw['ID'], 'FileSystemAssociations': []} for gw in fsx_gateways}
+        for batch in self.iter_association_batches(fsx_gateways):
+            for gw, assoc in batch:
+                report[gw['Name']]['FileSystemAssociations'].append(assoc)
+        return report
+
+    def get_cache_sizes(self, gateways):
+        """Maps gateway ID to allocated cache bytes via describe_cache (gateways without a cache are skipped)."""
+        def cache_size(gw):
+            try:
+                return self._call('describe_cache', GatewayARN=gw['ARN']).get('CacheAllocatedInBytes')
+            except ClientError as e:
+                self._note_error()
+                logging.warning(f"Could not describe cache for {gw['Name']}: {e}")
+                return None
+
+        with_cache = [gw for gw in gateways if gw['Type'] != 'STORED']
+        return {gw['ID']: size for gw, size in zip(with_cache, self._map(cache_size, with_cache))
+                if size is not None}
+
+    def sample_capacity(self, gateways):
+        """
+        Takes a point-in-time capacity sample per gateway from describe_cache
+        and, for volume/tape gateways, describe_upload_buffer. Returns {gateway ID:
+        {CachePercentDirty, CachePercentUsed, UploadBufferPercentUsed}} using
+        the CloudWatch metric names so it can feed forecast_capacity.
+        """
+        def sample(gw):
+            point = {}
+            try:
+                if gw['Type'] != 'STORED':
+                    cache = self._call('describe_cache', GatewayARN=gw['ARN'])
+                    point['CachePercentDirty'] = cache.get('CacheDirtyPercentage')
+                    point['CachePercentUsed'] = cache.get('CacheUsedPercentage')
+                if gw['Type'] in self.VOLUME_GATEWAY_TYPES + ['VTL']:
+                    buffer = self._call('describe_upload_buffer', GatewayARN=gw['ARN'])
+                    allocated = buffer.get('UploadBufferAllocatedInBytes') or 0
+                    if allocated:
+                        point['UploadBufferPercentUsed'] = 100.0 * buffer.get('UploadBufferUsedInBytes', 0) / allocated
+            except ClientError as e:
+                self._note_error()
+                logging.warning(f"Could not sample capacity for {gw['Name']}: {e}")
+            return point
+
+        return {gw['ID']: point for gw, point in zip(gateways, self._map(sample, gateways)) if point}
+
+    def collect_inventory_report(self, gateways=None):
+        """
+        Builds the full per-gateway report: shares for file gateways, file
+        system associations for FSx gateways, volumes for volume gateways.
+        """
+        if gateways is None:
+            gateways = self.get_detailed_status()
+        return self._merge_inventory(self.collect_share_report(gateways),
+                                     self.collect_association_report(gateways),
+                                     self.collect_volume_report(gateways))
+
+    @staticmethod
+    def _merge_inventory(share_report, association_report, volume_report):
+        """Folds FSx associations and volume entries into share_report (in place) and returns it."""
+        for name, entry in association_report.items():
+            share_report.setdefault(name, {'GatewayID': entry['GatewayID'], 'Shares': []})
+            share_report[name]['FileSystemAssociations'] = entry['FileSystemAssociations']
+        share_report.update(volume_report)
+        return share_report
+
+    def export_shares_to_json(self, filename='gateway_shares.json'):
+        """
+        Creates a JSON map of gateways and their shares, including 
+        IP allowed lists (NFS) and AD User/Group access (SMB). Volume
+        gateways appear with their iSCSI volumes instead of shares.
+        """
+        share_report = self.collect_inventory_report()
+
+        with open(filename, 'w') as f:
+            json.dump(share_report, f, indent=4)
+        logging.info(f"Detailed share report saved to {filename}")
+
+    def refresh_share_report(self, previous_state=None):
+        """
+        Incrementally rebuilds the share report. Only the cheap list_gateways
+        and list_file_shares calls are made for everything. Shares are
+        described again only if they are new, their status or type changed,
+        or their gateway's state changed; all other share details are carried
+        forward from previous_state. Returns (share_report, state, counts),
+        and state is what to pass back in on the next refresh.
+        """
+        previous_state = previous_state or {'Gateways': {}, 'Shares': {}}
+        old_gateways, old_shares = previous_state['Gateways'], previous_state['Shares']
+        gateways = self.get_detailed_status(shallow=True)
+        file_gateways = [gw for gw in gateways if gw['Type'] in ['FILE_S3', 'FILE_FSX_SMB']]
+        # The listing drives change detection, so it must never come from the cache
+        listings = self._list_shares_by_gateway(file_gateways, cached=False)
+
+        described, changed = {}, {'NFS': [], 'SMB': []}
+        for gw in file_gateways:
+            gateway_changed = old_gateways.get(gw['ARN'], {}).get('Status') != gw['Status']
+            for s in listings.get(gw['ARN'], []):
+                old = old_shares.get(s['FileShareARN'])
+                if (not gateway_changed and old is not None
+                        and old['FileShareStatus'] == s.get('FileShareStatus')
+                        and old['FileShareType'] == s['FileShareType']):
+                    described[s['FileShareARN']] = old['Detail']
+                elif s['FileShareType'] in changed:
+                    changed[s['FileShareType']].append(s['FileShareARN'])
+
+        for share_type, arns in changed.items():
+            # These shares changed, so a cached describe would pair the new status with old details
+            for share in self._get_share_details(arns, share_type, cached=False):
+                described[share['FileShareARN']] = self._format_share(share, share_type)
+
+        # A gateway that failed to list keeps its previous shares rather than appearing empty
+        for gw in file_gateways:
+            if gw['ARN'] in listings:
+                continue
+            carried = {arn: old for arn, old in old_shares.items() if old['GatewayARN'] == gw['ARN']}
+            if carried:
+                listings[gw['ARN']] = [{'FileShareARN': arn, 'FileShareType': old['FileShareType'],
+                                        'FileShareStatus': old['FileShareStatus']}
+                                       for arn, old in carried.items()]
+                described.update({arn: old['Detail'] for arn, old in carried.items()})
+
+        listed = {s['FileShareARN'] for shares_info in listings.values() for s in shares_info}
+        described_count = sum(len(arns) for arns in changed.values())
+        counts = {
+            'Described': described_count,
+            'CarriedForward': len(described) - described_count,
+            'Removed': len(set(old_shares) - listed)
+        }
+        logging.info(f"Incremental refresh: {counts['Described']} described, "
+                     f"{counts['CarriedForward']} carried forward, {counts['Removed']} removed")
+
+        state = {
+            'Gateways': {gw['ARN']: gw for gw in gateways},
+            'Shares': {
+                s['FileShareARN']: {
+                    'GatewayARN': gw_arn,
+                    'FileShareStatus': s.get('FileShareStatus'),
+                    'FileShareType': s['FileShareType'],
+                    'Detail': described[s['FileShareARN']]
+                }
+                for gw_arn, shares_info in listings.items() for s in shares_info
+                if s['FileShareARN'] in described
+            }
+        }
+        return self._assemble_report(file_gateways, listings, described), state, counts
+
+    def refresh_inventory_report(self, previous_state=None):
+        """
+        Same as refresh_share_report, but the report also has the FSx
+        associations and volumes, like collect_inventory_report. Only shares
+        are carried forward; associations and volumes are collected again.
+        """
+        share_report, state, counts = self.refresh_share_report(previous_state)
+        gateways = list(state['Gateways'].values())
+        report = self._merge_inventory(share_report, self.collect_association_report(gateways),
+                                       self.collect_volume_report(gateways))
+        return report, state, counts
+
+    def export_shares_incremental(self, filename='gateway_shares.json', state_file='gateway_shares.state.json'):
+        """Refreshes the JSON inventory report using (and updating) the state saved by the previous run."""
+        previous_state = None
+        if os.path.exists(state_file):
+            with open(state_file) as f:
+                previous_state = json.load(f)
+        share_report, state, _ = self.refresh_inventory_report(previous_state)
+        with open(filename, 'w') as f:
+            json.dump(share_report, f, indent=4)
+        with open(state_file, 'w') as f:
+            json.dump(state, f)
+        logging.info(f"Detailed share report saved to {filename}")
+
+    def export_shares_to_ndjson(self, filename='gateway_shares.ndjson', gateways=None, include_tapes=True):
+        """
+        Streams the share report as newline-delimited JSON: one 'Gateway'
+        record per file gateway, then one 'Share' record per share, written
+        and flushed as each describe batch completes so memory stays flat.
+        FSx gateways add one 'FileSystemAssociation' record per association.
+        Volume gateways follow as a 'Gateway' record plus one 'Volume'
+        record per iSCSI volume, then (if there are VTL gateways) one 'Tape'
+        record per virtual or archived tape.
+        """
+        if gateways is None:
+            gateways = self.get_detailed_status()
+        file_gateways = [gw for gw in gateways if gw['Type'] in ['FILE_S3', 'FILE_FSX_SMB']]
+        count = 0
+        with open(filename, 'w') as f:
+            for gw in file_gateways:
+                f.write(json.dumps({'RecordType': 'Gateway', **gw}) + '\n')
+            f.flush()
+            for batch in self.iter_share_batches(file_gateways):
+                for gw, share_type, share in batch:
+                    record = {'RecordType': 'Share', 'Gateway': gw['Name'], 'GatewayID': gw['ID']}
+                    record.update(self._format_share(share, share_type))
+                    f.write(json.dumps(record) + '\n')
+                    count += 1
+                f.flush()
+            fsx_gateways = [gw for gw in file_gateways if gw['Type'] == 'FILE_FSX_SMB']
+            for batch in self.iter_association_batches(fsx_gateways):
+                for gw, assoc in batch:
+                    f.write(json.dumps({'RecordType': 'FileSystemAssociation', 'Gateway': gw['Name'],
+                                        'GatewayID': gw['ID'], **assoc}) + '\n')
+                    count += 1
+                f.flush()
+            for gw, volumes in self.iter_volume_reports(gateways):
+                f.write(json.dumps({'RecordType': 'Gateway', **gw}) + '\n')
+                for volume in volumes:
+                    f.write(json.dumps({'RecordType': 'Volume', 'Gateway': gw['Name'],
+                                        'GatewayID': gw['ID'], **volume}) + '\n')
+                    count += 1
+                f.flush()
+            tape_gateways = [gw for gw in gateways if gw['Type'] == 'VTL']
+            if include_tapes and tape_gateways:
+                for gw in tape_gateways:
+                    f.write(json.dumps({'RecordType': 'Gateway', **gw}) + '\n')
+                for record in self.iter_tape_records(gateways):
+                    f.write(json.dumps({'RecordType': 'Tape', **record}) + '\n')
+                    count += 1
+                f.flush()
+        logging.info(f"Streamed {count} records to {filename}")
+
+    CSV_COLUMNS = ['Gateway', 'GatewayID', 'ShareID', 'Type', 'Path', 'Bucket', 'Status',
+                   'AllowedClients', 'AD_AllowedUsers', 'AD_AdminUsers', 'SMB_ACL_Enabled']
+    # List fields that explode=True turns into one row per entry
+    CSV_LIST_FIELDS = {'AllowedClients': 'AllowedClient', 'AD_AllowedUsers': 'ValidUser',
+                       'AD_AdminUsers': 'AdminUser'}
+
+    def export_shares_to_csv(self, filename='gateway_shares.csv', columns=None, explode=False,
+                             gateways=None):
+        """
+        Streams a flat share report to CSV, writing rows as each describe
+        batch completes. By default there is one row per share with list
+        fields joined by ';'. With explode=True there is one row per NFS
+        client or SMB user/admin entry, described by the EntryType and Entry
+        columns; the joined list columns are then left out (or blank, if
+        requested explicitly) so each row holds only its own entry.
+        """
+        if columns is None:
+            if explode:
+                columns = [c for c in self.CSV_COLUMNS if c not in self.CSV_LIST_FIELDS] + ['EntryType', 'Entry']
+            else:
+                columns = self.CSV_COLUMNS
+        if gateways is None:
+            gateways = self.get_detailed_status()
+        file_gateways = [gw for gw in gateways if gw['Type'] in ['FILE_S3', 'FILE_FSX_SMB']]
+        rows = 0
+        with open(filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns, restval='', extrasaction='ignore')
+            writer.writeheader()
+            for batch in self.iter_share_batches(file_gateways):
+                for gw, share_type, share in batch:
+                    record = {'Gateway': gw['Name'], 'GatewayID': gw['ID']}
+                    record.update(self._format_share(share, share_type))
+                    entries = [(entry_type, value) for field, entry_type in self.CSV_LIST_FIELDS.items()
+                               for value in record.get(field, [])]
+                    explode_share = explode and entries
+                    for field in self.CSV_LIST_FIELDS:
+                        if field in record:
+                            record[field] = '' if explode_share else ';'.join(record[field])
+                    if explode_share:
+                        for entry_type, value in entries:
+                            writer.writerow(dict(record, EntryType=entry_type, Entry=value))
+                            rows += 1
+                    else:
+                        writer.writerow(record)
+                        rows += 1
+                f.flush()
+        logging.info(f"Streamed {rows} CSV rows to {filename}")
 
-    def _get_share_details(self, share_arns, share_type):
+    @staticmethod
+    def _arrow_schemas():
+        """Typed Arrow schemas for the gateway and share snapshots."""
+        import pyarrow as pa
+        category = pa.dictionary(pa.int32(), pa.string())
+        names = pa.list_(pa.string())
+        gateway_schema = pa.schema([
+            ('Name', pa.string()),
+            ('ID', pa.string()),
+            ('Status', category),
+            ('Type', category),
+            ('ARN', pa.string())
+        ])
+        share_schema = pa.schema([
+            ('Gateway', category),
+            ('GatewayID', category),
+            ('ShareID', pa.string()),
+            ('Type', category),
+            ('Path', pa.string()),
+            ('Bucket', category),
+            ('Status', category),
+            ('AllowedClients', names),
+            ('AD_AllowedUsers', names),
+            ('AD_AllowedGroups', names),
+            ('AD_AdminUsers', names),
+            ('SMB_ACL_Enabled', pa.bool_())
+        ])
+        return gateway_schema, share_schema
+
+    def export_snapshot_to_parquet(self, gateways_file='gateways.parquet', shares_file='shares.parquet',
+                                   row_group_size=50000, gateways=None):
+        """
+        Writes columnar Parquet snapshots of the gateways and their shares.
+        Shares are buffered only up to row_group_size rows and then written
+        out as a row group. Status, Type and Bucket are dictionary encoded.
+        Requires pyarrow.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet export requires pyarrow (pip install pyarrow)") from e
+
+        gateway_schema, share_schema = self._arrow_schemas()
+        if gateways is None:
+            gateways = self.get_detailed_status()
+        pq.write_table(pa.Table.from_pylist(gateways, schema=gateway_schema), gateways_file)
+
+        file_gateways = [gw for gw in gateways if gw['Type'] in ['FILE_S3', 'FILE_FSX_SMB']]
+        pending, rows = [], 0
+        with pq.ParquetWriter(shares_file, share_schema) as writer:
+            for batch in self.iter_share_batches(file_gateways):
+                for gw, share_type, share in batch:
+                    record = {'Gateway': gw['Name'], 'GatewayID': gw['ID']}
+                    record.update(self._format_share(share, share_type))
+                    pending.append(record)
+                if len(pending) >= row_group_size:
+                    writer.write_table(pa.Table.from_pylist(pending, schema=share_schema))
+                    rows += len(pending)
+                    pending = []
+            if pending:
+                writer.write_table(pa.Table.from_pylist(pending, schema=share_schema))
+                rows += len(pending)
+        logging.info(f"Parquet snapshot saved to {gateways_file} ({len(gateways)} gateways) "
+                     f"and {shares_file} ({rows} shares)")
+
+class AsyncStorageGatewayManager:
+    """
+    asyncio counterpart of StorageGatewayManager built on aiobotocore.
+    A semaphore caps the number of in-flight requests. Use it as an
+    async context manager so the underlying client is opened and closed:
+
+        async with AsyncStorageGatewayManager('us-east-1') as mgr:
+            await mgr.export_shares_to_json('shares.json')
+    """
+
+    def __init__(self, region_name='us-east-1', max_concurrency=50):
+        self.region = region_name
+        self.max_concurrency = max_concurrency
+        self.client = None
+        self._client_ctx = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        try:
+            from aiobotocore.session import get_session
+        except ImportError as e:
+            raise ImportError("AsyncStorageGatewayManager requires aiobotocore (pip install aiobotocore)") from e
+        config = client_factory.config(max_pool_connections=self.max_concurrency)
+        self._client_ctx = get_session().create_client('storagegateway', region_name=self.region, config=config)
+        self.client = await self._client_ctx.__aenter__()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._client_ctx.__aexit__(exc_type, exc, tb)
+        self.client = None
+
+    async def _call(self, operation, **kwargs):
+        """Runs one API call under the in-flight semaphore."""
+        async with self._semaphore:
+            return await getattr(self.client, operation)(**kwargs)
+
+    async def _paginate(self, operation, key, **kwargs):
+        """Collects every item under key across all pages of operation."""
+        items = []
+        paginator = self.client.get_paginator(operation)
+        async with self._semaphore:
+            async for page in paginator.paginate(**kwargs):
+                items.extend(page.get(key, []))
+        return items
+
+    async def list_all_gateways(self):
+        """Retrieves all gateway ARNs using a paginator."""
+        try:
+            return await self._paginate('list_gateways', 'Gateways')
+        except ClientError as e:
+            logging.error(f"Failed to list gateways: {e}")
+            return []
+
+    async def _describe_gateway(self, gateway_arn):
+        """Describes a single gateway, returning None if the call fails."""
+        try:
+            info = await self._call('describe_gateway_information', GatewayARN=gateway_arn)
+            return {
+                'Name': info.get('GatewayName', 'N/A'),
+                'ID': info.get('GatewayId', 'N/A'),
+                'Status': info.get('GatewayState', 'UNKNOWN'),
+                'Type': info.get('GatewayType', 'N/A'),
+                'ARN': gateway_arn
+            }
+        except ClientError as e:
+            logging.warning(f"Could not describe gateway {gateway_arn}: {e}")
+            return None
+
+    async def get_detailed_status(self, shallow=False):
+        """Returns high-level metadata for all gateways, in ARN order."""
+        gateways = sorted(await self.list_all_gateways(), key=lambda gw: gw['GatewayARN'])
+        if shallow:
+            return [StorageGatewayManager._shallow_record(gw) for gw in gateways]
+        results = await asyncio.gather(*(self._describe_gateway(gw['GatewayARN']) for gw in gateways))
+        return [r for r in results if r is not None]
+
+    async def _describe_share_batch(self, batch, share_type):
+        """Describes up to 10 shares of one type in a single call."""
+        try:
+            if share_type == 'NFS':
+                response = await self._call('describe_nfs_file_shares', FileShareARNList=batch)
+                return response.get('NFSFileShareInfoList', [])
+            response = await self._call('describe_smb_file_shares', FileShareARNList=batch)
+            return response.get('SMBFileShareInfoList', [])
+        except ClientError as e:
+            logging.error(f"Failed to describe {share_type} shares: {e}")
+            return []
+
+    async def _get_share_details(self, share_arns, share_type):
         """Batches and fetches deep details for specific shares (NFS or SMB)."""
-        details = []
         # AWS limits describe calls to 10 ARNs at a time
-        for i in range(0, len(share_arns), 10):
-            batch = share_arns[i:i+10]
+        batches = [share_arns[i:i+10] for i in range(0, len(share_arns), 10)]
+        results = await asyncio.gather(*(self._describe_share_batch(b, share_type) for b in batches))
+        return [share for batch in results for share in batch]
+
+    async def _list_gateway_shares(self, gw):
+        """Lists the basic share info for one gateway, or None if listing fails."""
+        try:
+            return await self._paginate('list_file_shares', 'FileShareInfoList', GatewayARN=gw['ARN'])
+        except ClientError as e:
+            logging.error(f"Error gathering share data for {gw['Name']}: {e}")
+            return None
+
+    async def collect_share_report(self, gateways=None):
+        """Builds the per-gateway share report using globally packed describe batches."""
+        if gateways is None:
+            gateways = await self.get_detailed_status()
+        file_gateways = [gw for gw in gateways if gw['Type'] in ['FILE_S3', 'FILE_FSX_SMB']]
+        results = await asyncio.gather(*(self._list_gateway_shares(gw) for gw in file_gateways))
+        listings = {gw['ARN']: info for gw, info in zip(file_gateways, results) if info is not None}
+        share_arns = StorageGatewayManager._pool_share_arns(listings)
+
+        described = {}
+        details = await asyncio.gather(*(self._get_share_details(arns, t) for t, arns in share_arns.items()))
+        for share_type, shares in zip(share_arns, details):
+            for share in shares:
+                described[share['FileShareARN']] = StorageGatewayManager._format_share(share, share_type)
+        return StorageGatewayManager._assemble_report(file_gateways, listings, described)
+
+    async def _gateway_volumes(self, gw):
+        """Lists and describes every volume on one volume gateway, or None if listing fails."""
+        try:
+            arns = [v['VolumeARN'] for v in await self._paginate('list_volumes', 'VolumeInfos', GatewayARN=gw['ARN'])]
+        except ClientError as e:
+            logging.error(f"Error gathering volume data for {gw['Name']}: {e}")
+            return None
+        operation, key = (('describe_cached_iscsi_volumes', 'CachediSCSIVolumes') if gw['Type'] == 'CACHED'
+                          else ('describe_stored_iscsi_volumes', 'StorediSCSIVolumes'))
+
+        async def describe(batch):
             try:
-                if share_type == 'NFS':
-                    response = self.client.describe_nfs_file_shares(FileShareARNList=batch)
-                    details.extend(response.get('NFSFileShareInfoList', []))
-                else:
-                    response = self.client.describe_smb_file_shares(FileShareARNList=batch)
-                    details.extend(response.get('SMBFileShareInfoList', []))
+                return (await self._call(operation, VolumeARNs=batch)).get(key, [])
             except ClientError as e:
-                logging.error(f"Failed to describe {share_type} shares: {e}")
-        return details
+                logging.error(f"Failed to describe {gw['Type']} volumes on {gw['Name']}: {e}")
+                return []
+
+        size = StorageGatewayManager.VOLUME_BATCH_SIZE
+        results = await asyncio.gather(*(describe(arns[i:i+size]) for i in range(0, len(arns), size)))
+        return [StorageGatewayManager._format_volume(v, gw['Type']) for batch in results for v in batch]
+
+    async def collect_volume_report(self, gateways):
+        """Builds {gateway name: {GatewayID, Volumes}} for the volume gateways."""
+        volume_gateways = [gw for gw in gateways if gw['Type'] in StorageGatewayManager.VOLUME_GATEWAY_TYPES]
+        results = await asyncio.gather(*(self._gateway_volumes(gw) for gw in volume_gateways))
+        return {gw['Name']: {'GatewayID': gw['ID'], 'Volumes': volumes}
+                for gw, volumes in zip(volume_gateways, results) if volumes is not None}
+
+    async def _list_gateway_associations(self, gw):
+        """Lists FSx file system association summaries for one gateway, or None if listing fails."""
+        try:
+            return await self._paginate('list_file_system_associations', 'FileSystemAssociationSummaryList',
+                                        GatewayARN=gw['ARN'])
+        except ClientError as e:
+            logging.error(f"Error gathering file system associations for {gw['Name']}: {e}")
+            return None
+
+    async def _describe_association_batch(self, batch):
+        """Describes up to 10 file system associations in a single call."""
+        try:
+            response = await self._call('describe_file_system_associations', FileSystemAssociationARNList=batch)
+            return response.get('FileSystemAssociationInfoList', [])
+        except ClientError as e:
+            logging.error(f"Failed to describe file system associations: {e}")
+            return []
+
+    async def collect_association_report(self, gateways):
+        """Builds {gateway name: {GatewayID, FileSystemAssociations}} for FILE_FSX_SMB gateways."""
+        fsx_gateways = [gw for gw in gateways if gw['Type'] == 'FILE_FSX_SMB']
+        results = await asyncio.gather(*(self._list_gateway_associations(gw) for gw in fsx_gateways))
+        owners = {a['FileSystemAssociationARN']: gw
+                  for gw, summaries in zip(fsx_gateways, results) for a in summaries or []}
+        arns = list(owners)
+        batches = await asyncio.gather(*(self._describe_association_batch(arns[i:i+10])
+                                         for i in range(0, len(arns), 10)))
+        report = {gw['Name']: {'GatewayID': gw['ID'], 'FileSystemAssociations': []} for gw in fsx_gateways}
+        for batch in batches:
+            for a in batch:
+                gw = owners[a['FileSystemAssociationARN']]
+                report[gw['Name']]['FileSystemAssociations'].append(StorageGatewayManager._format_association(a))
+        return report
+
+    async def collect_inventory_report(self, gateways=None):
+        """Async version of StorageGatewayManager.collect_inventory_report."""
+        if gateways is None:
+            gateways = await self.get_detailed_status()
+        shares, associations, volumes = await asyncio.gather(self.collect_share_report(gateways),
+                                                             self.collect_association_report(gateways),
+                                                             self.collect_volume_report(gateways))
+        return StorageGatewayManager._merge_inventory(shares, associations, volumes)
+
+    async def export_shares_to_json(self, filename='gateway_shares.json'):
+        """Async version of StorageGatewayManager.export_shares_to_json."""
+        share_report = await self.collect_inventory_report()
+
+        def write():
+            with open(filename, 'w') as f:
+                json.dump(share_report, f, indent=4)
+
+        await asyncio.to_thread(write)
+        logging.info(f"Detailed share report saved to {filename}")
+
+class MultiRegionManager:
+    """
+    Inventories every enabled region in parallel, one StorageGatewayManager
+    (and therefore one client) per region. Per-region wall time and API
+    error counts are kept in self.region_stats.
+    """
+
+    def __init__(self, regions=None, region_workers=8, max_workers=1, factory=None):
+        self.regions = regions or self.discover_regions()
+        self.region_workers = region_workers
+        self.max_workers = max_workers
+        self.factory = factory
+        self.region_stats = {}
+
+    @staticmethod
+    def discover_regions():
+        """Returns the Storage Gateway regions that are enabled for this account."""
+        session = boto3.session.Session()
+        supported = set(session.get_available_regions('storagegateway'))
+        try:
+            ec2 = client_factory.get_client('ec2', session.region_name or 'us-east-1')
+            enabled = {r['RegionName'] for r in ec2.describe_regions()['Regions']}
+        except (BotoCoreError, ClientError) as e:
+            logging.warning(f"Could not list enabled regions, using all supported regions: {e}")
+            return sorted(supported)
+        return sorted(supported & enabled)
+
+    def _run_region(self, region, task):
+        """Runs task(manager) for one region and records its timing and error count."""
+        start = time.monotonic()
+        result, errors, api_stats = {}, 0, {}
+        try:
+            mgr = StorageGatewayManager(region_name=region, max_workers=self.max_workers, factory=self.factory)
+            result = task(mgr)
+            errors = mgr.error_count
+            api_stats = mgr.limiter.stats()
+        except Exception as e:
+            logging.error(f"Inventory failed for region {region}: {e}")
+            errors += 1
+        self.region_stats[region] = {
+            'Seconds': round(time.monotonic() - start, 3),
+            'Errors': errors,
+            'Api': api_stats
+        }
+        return result
+
+    def _fan_out(self, task):
+        """Runs task against every region in parallel, returning {region: result}."""
+        with ThreadPoolExecutor(max_workers=min(self.region_workers, len(self.regions)) or 1) as pool:
+            results = pool.map(lambda region: self._run_region(region, task), self.regions)
+            return dict(zip(self.regions, results))
+
+    def get_detailed_status(self, shallow=False):
+        """
+        Returns {region: {gateway ID: status record}} for all regions.
+        Gateway names need not be unique, so records are keyed by ID.
+        """
+        by_region = self._fan_out(lambda mgr: mgr.get_detailed_status(shallow=shallow))
+        return {region: {gw['ID']: gw for gw in gateways}
+                for region, gateways in by_region.items()}
+
+    def collect_share_report(self):
+        """Returns {region: share report} for all regions."""
+        return self._fan_out(lambda mgr: mgr.collect_inventory_report())
 
     def export_shares_to_json(self, filename='gateway_shares.json'):
+        """Writes the merged multi-region share report along with per-region stats."""
+        report = {
+            'Regions': self.collect_share_report(),
+            'RegionStats': self.region_stats
+        }
+        with open(filename, 'w') as f:
+            json.dump(report, f, indent=4)
+        logging.info(f"Multi-region share report saved to {filename}")
+
+class MultiAccountManager:
+    """
+    Inventories many AWS accounts by assuming role_name in each one.
+    Assumed-role sessions are cached per account and refresh their STS
+    credentials automatically before they expire. Accounts run in parallel
+    on a thread pool (the work is network bound, so it is sized well above
+    the core count). Each account has account_timeout seconds: after that
+    its managers stop issuing calls, and the run reports it as timed out
+    without waiting for the daemon worker thread to finish.
+    """
+
+    def __init__(self, account_ids, role_name='StorageGatewayInventory', regions=('us-east-1',),
+                 max_workers=None, max_workers_per_region=1, account_timeout=900,
+                 external_id=None, duration_seconds=3600, factory=None):
+        self.account_ids = list(account_ids)
+        self.role_name = role_name
+        self.regions = list(regions)
+        self.max_workers = max_workers or min(len(self.account_ids), (os.cpu_count() or 1) * 8) or 1
+        self.max_workers_per_region = max_workers_per_region
+        self.account_timeout = account_timeout
+        self.external_id = external_id
+        self.duration_seconds = duration_seconds
+        self.factory = factory
+        self.account_stats = {}
+        self._managers = {}
+        self._stats_lock = threading.Lock()
+        self._sts = (factory or client_factory).get_client('sts', None)
+        self._sessions = {}
+        self._session_lock = threading.Lock()
+
+    def _assume_role(self, account_id):
+        """Calls STS and returns credentials in the shape RefreshableCredentials expects."""
+        params = {
+            'RoleArn': f"arn:aws:iam::{account_id}:role/{self.role_name}",
+            'RoleSessionName': 'storage-gateway-inventory',
+            'DurationSeconds': self.duration_seconds
+        }
+        if self.external_id:
+            params['ExternalId'] = self.external_id
+        creds = self._sts.assume_role(**params)['Credentials']
+        return {
+            'access_key': creds['AccessKeyId'],
+            'secret_key': creds['SecretAccessKey'],
+            'token': creds['SessionToken'],
+            'expiry_time': creds['Expiration'].isoformat()
+        }
+
+    def session_for(self, account_id):
+        """Returns a cached boto3 session whose credentials refresh themselves."""
+        with self._session_lock:
+            if account_id in self._sessions:
+                return self._sessions[account_id]
+        # Assume the role outside the lock so accounts don't queue behind each other's STS calls
+        credentials = RefreshableCredentials.create_from_metadata(
+            metadata=self._assume_role(account_id),
+            refresh_using=lambda: self._assume_role(account_id),
+            method='sts-assume-role'
+        )
+        botocore_session = botocore.session.get_session()
+        botocore_session._credentials = credentials
+        with self._session_lock:
+            return self._sessions.setdefault(account_id, boto3.session.Session(botocore_session=botocore_session))
+
+    def _run_account(self, account_id, task, deadline):
         """
-        Creates a JSON map of gateways and their shares, including 
-        IP allowed lists (NFS) and AD User/Group access (SMB).
+        Runs task(manager) in every region of one account, returning {region: result}.
+        Managers get the account deadline, so once it passes they raise
+        DeadlineExceeded instead of making further calls.
         """
-        gateways = self.get_detailed_status()
-        share_report = {}
+        session = self.session_for(account_id)
+        results = {}
+        for region in self.regions:
+            mgr = StorageGatewayManager(region_name=region, max_workers=self.max_workers_per_region,
+                                        session=session, account=account_id, role=self.role_name,
+                                        factory=self.factory, deadline=deadline)
+            with self._stats_lock:
+                self._managers.setdefault(account_id, []).append(mgr)
+            results[region] = task(mgr)
+        return results
+
+    def _account_errors(self, account_id):
+        with self._stats_lock:
+            return sum(mgr.error_count for mgr in self._managers.get(account_id, []))
+
+    def _fan_out(self, task):
+        """
+        Runs task against every account in parallel, returning {account: {region: result}}.
+        Workers are daemon threads, so an account that overruns account_timeout
+        is reported as timed out and can't keep the process alive at exit. Its
+        worker is replaced so the accounts still queued keep being served, and
+        exits once the abandoned account returns.
+        """
+        self._managers = {}
+        todo, finished = queue.Queue(), queue.Queue()
+        for account_id in self.account_ids:
+            todo.put(account_id)
+        started, abandoned = {}, set()
 
-        for gw in gateways:
-            if gw['Type'] in ['FILE_S3', 'FILE_FSX_SMB']:
-                logging.info(f"Processing shares for {gw['Name']}...")
+        def worker():
+            while True:
+                try:
+                    account_id = todo.get_nowait()
+                except queue.Empty:
+                    return
+                started[account_id] = time.monotonic()
                 try:
-                    # 1. List basic share ARNs for this gateway
-                    paginator = self.client.get_paginator('list_file_shares')
-                    shares_info = []
-                    for page in paginator.paginate(GatewayARN=gw['ARN']):
-                        shares_info.extend(page.get('FileShareInfoList', []))
-                    
-                    # 2. Separate ARNs by type for batch describing
-                    nfs_arns = [s['FileShareARN'] for s in shares_info if s['FileShareType'] == 'NFS']
-                    smb_arns = [s['FileShareARN'] for s in shares_info if s['FileShareType'] == 'SMB']
-
-                    # 3. Fetch deep details (Permissions/Access)
-                    full_details = []
-                    
-                    for share in self._get_share_details(nfs_arns, 'NFS'):
-                        full_details.append({
-                            'ShareID': share.get('FileShareId'),
-                            'Type': 'NFS',
-                            'Path': share.get('Path'),
-                            'Bucket': share.get('LocationARN'),
-                            'AllowedClients': share.get('ClientList', []), # IP Ranges
-                            'Status': share.get('FileShareStatus')
-                        })
-
-                    for share in self._get_share_details(smb_arns, 'SMB'):
-                        full_details.append({
-                            'ShareID': share.get('FileShareId'),
-                            'Type': 'SMB',
-                            'Path': share.get('Path'),
-                            'Bucket': share.get('LocationARN'),
-                            'AD_AllowedUsers': share.get('ValidUserList', []),
-                            'AD_AllowedGroups': [u for u in share.get('ValidUserList', []) if u.startswith('@')],
-                            'AD_AdminUsers': share.get('AdminUserList', []),
-                            'Status': share.get('FileShareStatus'),
-                            'SMB_ACL_Enabled': share.get('SMBACLEnabled', False)
-                        })
-
-                    share_report[gw['Name']] = {
-                        'GatewayID': gw['ID'],
-                        'Shares': full_details
-                    }
-
-                except ClientError as e:
-                    logging.error(f"Error gathering share data for {gw['Name']}: {e}")
+                    outcome = ('ok', self._run_account(account_id, task, started[account_id] + self.account_timeout))
+                except Exception as e:
+                    outcome = ('error', e)
+                finished.put((account_id, outcome))
+                if account_id in abandoned:
+                    return
 
+        start_worker = lambda: threading.Thread(target=worker, daemon=True).start()
+        for _ in range(min(self.max_workers, len(self.account_ids))):
+            start_worker()
+
+        results, pending = {}, set(self.account_ids)
+        while pending:
+            try:
+                account_id, (status, value) = finished.get(timeout=1)
+            except queue.Empty:
+                account_id = None
+            if account_id in pending:
+                pending.discard(account_id)
+                elapsed = round(time.monotonic() - started[account_id], 3)
+                timed_out = status == 'error' and isinstance(value, DeadlineExceeded)
+                errors = self._account_errors(account_id)
+                if status == 'ok':
+                    results[account_id] = value
+                elif timed_out:
+                    logging.error(f"Account {account_id} timed out after {self.account_timeout}s")
+                else:
+                    logging.error(f"Inventory failed for account {account_id}: {value}")
+                    errors += 1
+                self.account_stats[account_id] = {'Seconds': elapsed, 'Errors': errors, 'TimedOut': timed_out}
+            now = time.monotonic()
+            for account_id in list(pending):
+                if account_id in started and now - started[account_id] > self.account_timeout:
+                    # Don't wait for an in-flight call to return; the daemon worker is abandoned
+                    logging.error(f"Account {account_id} timed out after {self.account_timeout}s")
+                    self.account_stats[account_id] = {'Seconds': self.account_timeout,
+                                                      'Errors': self._account_errors(account_id),
+                                                      'TimedOut': True}
+                    pending.discard(account_id)
+                    abandoned.add(account_id)
+                    start_worker()
+        return {account_id: results[account_id] for account_id in self.account_ids if account_id in results}
+
+    def get_detailed_status(self, shallow=False):
+        """Returns {account: {region: [status records]}}."""
+        return self._fan_out(lambda mgr: mgr.get_detailed_status(shallow=shallow))
+
+    def collect_share_report(self):
+        """Returns {account: {region: share report}}."""
+        return self._fan_out(lambda mgr: mgr.collect_inventory_report())
+
+    def export_shares_to_json(self, filename='gateway_shares.json'):
+        """Writes the merged multi-account share report along with per-account stats."""
+        report = {
+            'Accounts': self.collect_share_report(),
+            'AccountStats': self.account_stats
+        }
         with open(filename, 'w') as f:
+            json.dump(report, f, indent=4)
+        logging.info(f"Multi-account share report saved to {filename}")
+
+class MetricCollector:
+    """
+    Fleet-wide CloudWatch collector for AWS/StorageGateway metrics. One
+    GetMetricData query is built per (gateway, metric) pair, and up to 500
+    queries are packed into each call, with NextToken pages followed to the
+    end. Results are aligned on a shared time grid and returned as NumPy
+    arrays, with NaN wherever CloudWatch returned no datapoint. Requires numpy.
+    """
+
+    # metric name -> statistic
+    METRICS = {
+        'CachePercentDirty': 'Average',
+        'CacheHitPercent': 'Average',
+        'CloudBytesUploaded': 'Sum',
+        'HealthNotifications': 'Sum'
+    }
+    # Longer-window series used by forecast_capacity
+    CAPACITY_METRICS = {
+        'CachePercentDirty': 'Average',
+        'CachePercentUsed': 'Average',
+        'UploadBufferPercentUsed': 'Average'
+    }
+    MAX_QUERIES = 500
+
+    def __init__(self, region_name='us-east-1', session=None, account=None, role=None, factory=None):
+        self.client = (factory or client_factory).get_client(
+            'cloudwatch', region_name, session=session, account=account, role=role, max_attempts=0)
+        self.limiter = (factory or client_factory).get_limiter(account, region_name)
+        self.region = region_name
+
+    def _queries(self, gateway_ids, metrics, period):
+        """Builds the MetricDataQueries plus a map from query Id to (gateway ID, metric)."""
+        queries, index = [], {}
+        for g, gateway_id in enumerate(gateway_ids):
+            for m, (metric, stat) in enumerate(metrics.items()):
+                query_id = f"g{g}_m{m}"
+                index[query_id] = (gateway_id, metric)
+                queries.append({
+                    'Id': query_id,
+                    'MetricStat': {
+                        'Metric': {
+                            'Namespace': 'AWS/StorageGateway',
+                            'MetricName': metric,
+                            'Dimensions': [{'Name': 'GatewayId', 'Value': gateway_id}]
+                        },
+                        'Period': period,
+                        'Stat': stat
+                    },
+                    'ReturnData': True
+                })
+        return queries, index
+
+    def _fetch(self, queries, start, end):
+        """Runs one GetMetricData batch through every NextToken page, yielding each result."""
+        params = {'MetricDataQueries': queries, 'StartTime': start, 'EndTime': end,
+                  'ScanBy': 'TimestampAscending'}
+        while True:
+            response = self.limiter.call('get_metric_data', self.client.get_metric_data, **params)
+            yield from response.get('MetricDataResults', [])
+            if not response.get('NextToken'):
+                return
+            params['NextToken'] = response['NextToken']
+
+    def collect(self, gateways, start=None, end=None, period=300, metrics=None):
+        """
+        Collects metrics for gateways, which are get_detailed_status records
+        or plain gateway IDs. The window defaults to the last 3 hours.
+        Returns (timestamps, data): timestamps is a datetime64[s] array of
+        length T, and data is {gateway ID: {metric: float64 array of length T}}.
+        """
+        import numpy as np
+        metrics = metrics or self.METRICS
+        end = end or datetime.now(timezone.utc)
+        start = start or end - timedelta(hours=3)
+        # Align the grid to period boundaries so every series lands on the same slots
+        t0 = int(start.timestamp()) // period * period
+        slots = max(1, (int(end.timestamp()) - t0) // period + 1)
+        timestamps = (np.arange(slots, dtype='int64') * period + t0).astype('datetime64[s]')
+
+        gateway_ids = [gw['ID'] if isinstance(gw, dict) else gw for gw in gateways]
+        data = {gateway_id: {metric: np.full(slots, np.nan) for metric in metrics} for gateway_id in gateway_ids}
+        queries, index = self._queries(gateway_ids, metrics, period)
+        for i in range(0, len(queries), self.MAX_QUERIES):
+            try:
+                for result in self._fetch(queries[i:i+self.MAX_QUERIES], start, end):
+                    gateway_id, metric = index[result['Id']]
+                    if not result.get('Timestamps'):
+                        continue
+                    seconds = np.array([int(t.timestamp()) for t in result['Timestamps']], dtype='int64')
+                    slot = (seconds - t0) // period
+                    keep = (slot >= 0) & (slot < slots)
+                    data[gateway_id][metric][slot[keep]] = np.asarray(result['Values'], dtype='float64')[keep]
+            except ClientError as e:
+                logging.error(f"GetMetricData failed for query batch starting at {i}: {e}")
+        logging.info(f"Collected {len(metrics)} metrics for {len(gateway_ids)} gateways "
+                     f"in {(len(queries) + self.MAX_QUERIES - 1) // self.MAX_QUERIES} query batches")
+        return timestamps, data
+
+def _series_fit(x, y):
+    """
+    Batched least-squares line fit of each row of y (G x T) against x (T),
+    ignoring NaNs. Returns (slope, intercept) arrays, NaN where a row has
+    fewer than 2 points.
+    """
+    import numpy as np
+    w = ~np.isnan(y)
+    n = w.sum(axis=1)
+    xw = np.where(w, x, 0.0)
+    yw = np.where(w, y, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = xw.sum(axis=1) / n
+        y_mean = yw.sum(axis=1) / n
+        dx = np.where(w, x - x_mean[:, None], 0.0)
+        dy = np.where(w, y - y_mean[:, None], 0.0)
+        slope = (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+        intercept = y_mean - slope * x_mean
+    ok = n >= 2
+    return np.where(ok, slope, np.nan), np.where(ok, intercept, np.nan)
+
+def _series_slope(x, y):
+    """Per-row least-squares slope of y (G x T) against x (T), ignoring NaNs."""
+    return _series_fit(x, y)[0]
+
+def _last_valid(y):
+    """Last non-NaN value in each row of y, or NaN for rows with no data."""
+    import numpy as np
+    valid = ~np.isnan(y)
+    last = y.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    return np.where(valid.any(axis=1), y[np.arange(y.shape[0]), last], np.nan)
+
+def fleet_indicators(timestamps, data, cache_sizes=None, recent_slots=6):
+    """
+    Derives fleet-wide indicators from MetricCollector.collect output using
+    vectorized operations over gateway x time matrices. cache_sizes maps
+    gateway ID to allocated cache bytes (see get_cache_sizes).
+
+    Returns a dict of arrays aligned with 'GatewayIDs':
+      DirtyPercent         latest CachePercentDirty
+      DirtySlopePerHour    trend of CachePercentDirty, percentage points/hour
+      CacheHitPercent      mean CacheHitPercent over the window
+      CacheHitSlopePerHour trend of CacheHitPercent, percentage points/hour
+      UploadBytesPerSec    mean upload rate over the last recent_slots periods
+      BacklogEtaSeconds    dirty bytes / upload rate (inf if the measured rate is 0,
+                           NaN if the rate or cache size is unknown)
+      Risk                 0..3 score: dirty fill + dirty growth + backlog > 1h
+    """
+    import numpy as np
+    gateway_ids = list(data)
+    cache_sizes = cache_sizes or {}
+    if not gateway_ids:
+        return {'GatewayIDs': []}
+    stack = lambda metric: np.vstack([data[g][metric] for g in gateway_ids])
+    dirty, hits, uploaded = stack('CachePercentDirty'), stack('CacheHitPercent'), stack('CloudBytesUploaded')
+
+    seconds = timestamps.astype('datetime64[s]').astype('int64').astype('float64')
+    period = seconds[1] - seconds[0] if len(seconds) > 1 else 300.0
+    hours = (seconds - seconds[0]) / 3600.0
+
+    dirty_now = _last_valid(dirty)
+    dirty_slope = _series_slope(hours, dirty)
+    hit_slope = _series_slope(hours, hits)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        hit_mean = np.nansum(hits, axis=1) / (~np.isnan(hits)).sum(axis=1)
+        recent = uploaded[:, -recent_slots:]
+        upload_rate = np.nansum(recent, axis=1) / ((~np.isnan(recent)).sum(axis=1) * period)
+        cache_bytes = np.array([cache_sizes.get(g, np.nan) for g in gateway_ids], dtype='float64')
+        dirty_bytes = dirty_now / 100.0 * cache_bytes
+        # x / 0 gives inf and x / NaN stays NaN, so only a measured zero rate means "never"
+        eta = np.where(dirty_bytes > 0, dirty_bytes / upload_rate, np.where(np.isnan(dirty_bytes), np.nan, 0.0))
+
+    # An unknown ETA (NaN) compares False and adds no risk
+    risk = (np.nan_to_num(dirty_now) / 100.0
+            + np.clip(np.nan_to_num(dirty_slope) / 10.0, 0.0, 1.0)
+            + (eta > 3600).astype('float64'))
+    return {
+        'GatewayIDs': gateway_ids,
+        'DirtyPercent': dirty_now,
+        'DirtySlopePerHour': dirty_slope,
+        'CacheHitPercent': hit_mean,
+        'CacheHitSlopePerHour': hit_slope,
+        'UploadBytesPerSec': upload_rate,
+        'BacklogEtaSeconds': eta,
+        'Risk': risk
+    }
+
+def forecast_capacity(timestamps, data, metric='CachePercentDirty', threshold=100.0, current=None, now=None):
+    """
+    Fits a straight-line trend to metric for every gateway in one vectorized
+    least-squares pass, then predicts when each gateway reaches threshold
+    percent. data is MetricCollector.collect output (e.g. 14 days of hourly
+    CachePercentDirty or UploadBufferPercentUsed). current optionally maps
+    gateway ID to a fresh point value (see sample_capacity), added as a last
+    sample taken at now.
+
+    Returns arrays aligned with 'GatewayIDs': SlopePerDay (percentage points
+    per day), Current (fitted value now), DaysToFull (0 if already at
+    threshold, inf if flat or falling) and FullAt (datetime64, NaT if never).
+    """
+    import numpy as np
+    gateway_ids = list(data)
+    if not gateway_ids:
+        return {'GatewayIDs': []}
+    y = np.vstack([data[g][metric] for g in gateway_ids])
+    seconds = timestamps.astype('datetime64[s]').astype('int64').astype('float64')
+    now = now or datetime.now(timezone.utc)
+    now_s = float(int(now.timestamp()))
+    if current is not None:
+        column = np.array([current.get(g, {}).get(metric, np.nan) for g in gateway_ids], dtype='float64')
+        y = np.hstack([y, column[:, None]])
+        seconds = np.append(seconds, now_s)
+
+    days = (seconds - now_s) / 86400.0
+    slope, intercept = _series_fit(days, y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        days_to_full = np.where(intercept >= threshold, 0.0,
+                                np.where(slope > 0, (threshold - intercept) / slope, np.inf))
+    days_to_full = np.where(np.isnan(slope), np.nan, days_to_full)
+    finite = np.isfinite(days_to_full)
+    full_at = np.full(len(gateway_ids), np.datetime64('NaT'), dtype='datetime64[s]')
+    full_at[finite] = (now_s + days_to_full[finite] * 86400.0).astype('int64').astype('datetime64[s]')
+    return {
+        'GatewayIDs': gateway_ids,
+        'SlopePerDay': slope,
+        'Current': intercept,
+        'DaysToFull': days_to_full,
+        'FullAt': full_at
+    }
+
+class AnomalyDetector:
+    """
+    Streaming per-gateway, per-metric anomaly detector. State lives in
+    (gateways x metrics) NumPy arrays, and each gateway ID maps to a row
+    that grows by doubling. Each sample updates it in O(1): with
+    mode='ewma' an exponentially weighted mean/variance (controlled by
+    alpha), with mode='welford' the exact running mean/variance. A sample
+    is flagged when it sits more than `threshold` standard deviations from
+    the mean, and only after `warmup` samples for that series. The time of
+    the last absorbed sample is kept per series, so a datapoint that shows
+    up again in an overlapping collection window is not counted twice.
+    """
+
+    def __init__(self, metrics=None, mode='ewma', alpha=0.1, threshold=4.0, warmup=10, capacity=1024):
+        import numpy as np
+        if mode not in ('ewma', 'welford'):
+            raise ValueError(f"Unknown anomaly detector mode {mode!r}")
+        self.metrics = list(metrics or MetricCollector.METRICS)
+        self.mode = mode
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.rows = {}
+        shape = (capacity, len(self.metrics))
+        self.count = np.zeros(shape, dtype='int64')
+        self.mean = np.zeros(shape, dtype='float64')
+        self.var = np.zeros(shape, dtype='float64')  # EWMA variance, or Welford M2
+        self.last_seen = np.full(shape, np.iinfo('int64').min, dtype='int64')  # epoch seconds
+
+    def _row(self, gateway_id):
+        import numpy as np
+        row = self.rows.get(gateway_id)
+        if row is None:
+            row = self.rows[gateway_id] = len(self.rows)
+            if row >= self.count.shape[0]:
+                grow = lambda a: np.vstack([a, np.zeros_like(a)])
+                self.count, self.mean, self.var = grow(self.count), grow(self.mean), grow(self.var)
+                self.last_seen = np.vstack([self.last_seen, np.full_like(self.last_seen, np.iinfo('int64').min)])
+        return row
+
+    def _std(self, rows):
+        import numpy as np
+        if self.mode == 'ewma':
+            return np.sqrt(self.var[rows])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.var[rows] / (self.count[rows] - 1))
+
+    def update(self, samples, timestamp=None):
+        """
+        Scores and then absorbs one polling cycle. samples maps gateway ID to
+        {metric: value}; missing or None values are skipped. If timestamp (a
+        datetime, naive ones taken as UTC, or a numpy datetime64) is given,
+        values no newer than the last sample absorbed for that series are
+        skipped too. Returns a list of anomaly dicts (GatewayID, Metric,
+        Value, Mean, StdDev, ZScore).
+        """
+        import numpy as np
+        if not samples:
+            return []
+        gateway_ids = list(samples)
+        rows = np.array([self._row(g) for g in gateway_ids])
+        x = np.array([[np.nan if samples[g].get(m) is None else samples[g][m] for m in self.metrics]
+                      for g in gateway_ids], dtype='float64')
+        seen = ~np.isnan(x)
+        if timestamp is not None:
+            if isinstance(timestamp, datetime):
+                # numpy warns on timezone-aware datetimes, so convert to epoch seconds directly
+                t = int(timestamp.replace(tzinfo=timestamp.tzinfo or timezone.utc).timestamp())
+            else:
+                t = np.datetime64(timestamp, 's').astype('int64')
+            seen &= self.last_seen[rows] < t
+            x = np.where(seen, x, np.nan)
+
+        # Score against the state before this sample is absorbed
+        mean, std = self.mean[rows], self._std(rows)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = (x - mean) / std
+        ready = seen & (self.count[rows] >= self.warmup) & (std > 0)
+        flagged = ready & (np.abs(z) > self.threshold)
+
+        # O(1) state update per sample
+        count = self.count[rows] + seen
+        delta = np.where(seen, x - mean, 0.0)
+        if self.mode == 'ewma':
+            first = seen & (count == 1)
+            incr = self.alpha * delta
+            new_mean = np.where(first, x, mean + incr)
+            new_var = np.where(first, 0.0, np.where(seen, (1 - self.alpha) * (self.var[rows] + delta * incr),
+                                                    self.var[rows]))
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                new_mean = np.where(seen, mean + delta / count, mean)
+            new_var = self.var[rows] + np.where(seen, delta * (x - new_mean), 0.0)
+        self.count[rows], self.mean[rows], self.var[rows] = count, np.where(seen, new_mean, mean), new_var
+        if timestamp is not None:
+            self.last_seen[rows] = np.where(seen, t, self.last_seen[rows])
+
+        anomalies = []
+        for i, j in zip(*np.nonzero(flagged)):
+            anomalies.append({
+                'GatewayID': gateway_ids[i],
+                'Metric': self.metrics[j],
+                'Value': float(x[i, j]),
+                'Mean': float(mean[i, j]),
+                'StdDev': float(std[i, j]),
+                'ZScore': float(z[i, j])
+            })
+        return anomalies
+
+    def update_from_collection(self, timestamps, data):
+        """
+        Feeds MetricCollector.collect output (timestamps, data) in time order.
+        Only datapoints newer than the last one absorbed for each series are
+        used, so overlapping windows from repeated polls are safe. Each
+        anomaly also carries the Timestamp of the datapoint.
+        """
+        import numpy as np
+        timestamps = np.asarray(timestamps, dtype='datetime64[s]')
+        anomalies = []
+        for k in np.argsort(timestamps, kind='stable'):
+            samples = {}
+            for gateway_id, series in data.items():
+                values = {metric: float(series[metric][k]) for metric in self.metrics
+                          if metric in series and not np.isnan(series[metric][k])}
+                if values:
+                    samples[gateway_id] = values
+            for anomaly in self.update(samples, timestamps[k]):
+                anomaly['Timestamp'] = str(timestamps[k])
+                anomalies.append(anomaly)
+        return anomalies
+
+def attach_indicators(status_records, indicators):
+    """
+    Adds each indicator to the matching get_detailed_status record (by ID),
+    as a plain float, or None where it is NaN. Returns the records sorted by
+    Risk, highest first.
+    """
+    import numpy as np
+    position = {g: i for i, g in enumerate(indicators['GatewayIDs'])}
+    fields = [k for k in indicators if k != 'GatewayIDs']
+    for record in status_records:
+        i = position.get(record['ID'])
+        for field in fields:
+            value = None if i is None else float(indicators[field][i])
+            record[field] = None if value is None or np.isnan(value) else value
+    return sorted(status_records, key=lambda r: -(r.get('Risk') or 0.0))
+
+def _share_map(share_report):
+    """Maps (gateway ID, share ID) to share record for a share report."""
+    return {(entry['GatewayID'], share['ShareID']): share
+            for entry in share_report.values() for share in entry.get('Shares', [])}
+
+def diff_snapshots(old_gateways, old_report, new_gateways, new_report):
+    """
+    Yields change events between two inventory snapshots, each given as the
+    output of get_detailed_status and collect_share_report. Both sides are
+    keyed by gateway ID and (gateway ID, share ID) in dicts, so the
+    comparison runs in linear time. List changes are reported as Added and
+    Removed entries, not as full before/after lists.
+    """
+    old_gw = {gw['ID']: gw for gw in old_gateways}
+    new_gw = {gw['ID']: gw for gw in new_gateways}
+    for gw_id in old_gw.keys() - new_gw.keys():
+        yield {'Event': 'GatewayRemoved', 'GatewayID': gw_id, 'Name': old_gw[gw_id]['Name']}
+    for gw_id, gw in new_gw.items():
+        old = old_gw.get(gw_id)
+        if old is None:
+            yield {'Event': 'GatewayAdded', 'GatewayID': gw_id, 'Name': gw['Name'], 'Status': gw['Status']}
+        elif old['Status'] != gw['Status']:
+            yield {'Event': 'GatewayStateChanged', 'GatewayID': gw_id, 'Name': gw['Name'],
+                   'From': old['Status'], 'To': gw['Status']}
+
+    old_shares, new_shares = _share_map(old_report), _share_map(new_report)
+    for gw_id, share_id in old_shares.keys() - new_shares.keys():
+        yield {'Event': 'ShareRemoved', 'GatewayID': gw_id, 'ShareID': share_id}
+    for key, share in new_shares.items():
+        gw_id, share_id = key
+        old = old_shares.get(key)
+        if old is None:
+            yield {'Event': 'ShareAdded', 'GatewayID': gw_id, 'ShareID': share_id,
+                   'Type': share['Type'], 'Path': share['Path']}
+            continue
+        if old['Status'] != share['Status']:
+            yield {'Event': 'ShareStatusChanged', 'GatewayID': gw_id, 'ShareID': share_id,
+                   'From': old['Status'], 'To': share['Status']}
+        for field, event in (('AllowedClients', 'ClientListChanged'),
+                             ('AD_AllowedUsers', 'ValidUserListChanged'),
+                             ('AD_AdminUsers', 'AdminUserListChanged')):
+            before, after = set(old.get(field, [])), set(share.get(field, []))
+            if before != after:
+                yield {'Event': event, 'GatewayID': gw_id, 'ShareID': share_id,
+                       'Added': sorted(after - before), 'Removed': sorted(before - after)}
+
+class SnapshotStore:
+    """
+    SQLite store of inventory runs. Each write_run() call records the
+    gateways from get_detailed_status and the share report from
+    collect_share_report under a new run_id, in a single transaction.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            taken_at REAL NOT NULL,
+            account TEXT,
+            region TEXT
+        );
+        CREATE TABLE IF NOT EXISTS gateways (
+            run_id INTEGER NOT NULL REFERENCES runs(run_id),
+            gateway_id TEXT NOT NULL,
+            name TEXT,
+            status TEXT,
+            type TEXT,
+            arn TEXT,
+            PRIMARY KEY (run_id, gateway_id)
+        );
+        CREATE TABLE IF NOT EXISTS shares (
+            run_id INTEGER NOT NULL REFERENCES runs(run_id),
+            share_id TEXT NOT NULL,
+            gateway_id TEXT,
+            type TEXT,
+            path TEXT,
+            bucket TEXT,
+            status TEXT,
+            smb_acl_enabled INTEGER,
+            PRIMARY KEY (run_id, gateway_id, share_id)
+        );
+        CREATE TABLE IF NOT EXISTS share_clients (
+            run_id INTEGER NOT NULL,
+            share_id TEXT NOT NULL,
+            client TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS share_principals (
+            run_id INTEGER NOT NULL,
+            share_id TEXT NOT NULL,
+            principal TEXT NOT NULL,
+            is_group INTEGER NOT NULL,
+            access TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_runs_scope ON runs(account, region, taken_at);
+        CREATE INDEX IF NOT EXISTS idx_gateways_id ON gateways(gateway_id, run_id);
+        CREATE INDEX IF NOT EXISTS idx_gateways_status ON gateways(run_id, status);
+        CREATE INDEX IF NOT EXISTS idx_shares_bucket ON shares(bucket, run_id);
+        CREATE INDEX IF NOT EXISTS idx_shares_gateway ON shares(gateway_id, run_id);
+        CREATE INDEX IF NOT EXISTS idx_clients_client ON share_clients(client, run_id);
+        CREATE INDEX IF NOT EXISTS idx_clients_share ON share_clients(run_id, share_id);
+        CREATE INDEX IF NOT EXISTS idx_principals_principal ON share_principals(principal COLLATE NOCASE, run_id);
+        CREATE INDEX IF NOT EXISTS idx_principals_share ON share_principals(run_id, share_id);
+    """
+
+    def __init__(self, path='sgw_inventory.db'):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(self.SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def write_run(self, gateways, share_report, account=None, region=None, taken_at=None):
+        """Stores one inventory run with bulk inserts in a single transaction. Returns its run_id."""
+        shares, clients, principals = [], [], []
+        with self.conn:
+            cur = self.conn.execute("INSERT INTO runs (taken_at, account, region) VALUES (?, ?, ?)",
+                                    (taken_at or time.time(), account, region))
+            run_id = cur.lastrowid
+            self.conn.executemany(
+                "INSERT INTO gateways (run_id, gateway_id, name, status, type, arn) VALUES (?, ?, ?, ?, ?, ?)",
+                [(run_id, gw['ID'], gw['Name'], gw['Status'], gw['Type'], gw['ARN']) for gw in gateways])
+            for entry in share_report.values():
+                for share in entry.get('Shares', []):
+                    shares.append((run_id, share['ShareID'], entry['GatewayID'], share['Type'], share['Path'],
+                                   share['Bucket'], share['Status'], int(share.get('SMB_ACL_Enabled', False))))
+                    clients.extend((run_id, share['ShareID'], c) for c in share.get('AllowedClients', []))
+                    principals.extend((run_id, share['ShareID'], u, int(u.startswith('@')), 'valid')
+                                      for u in share.get('AD_AllowedUsers', []))
+                    principals.extend((run_id, share['ShareID'], u, int(u.startswith('@')), 'admin')
+                                      for u in share.get('AD_AdminUsers', []))
+            self.conn.executemany("INSERT INTO shares VALUES (?, ?, ?, ?, ?, ?, ?, ?)", shares)
+            self.conn.executemany("INSERT INTO share_clients VALUES (?, ?, ?)", clients)
+            self.conn.executemany("INSERT INTO share_principals VALUES (?, ?, ?, ?, ?)", principals)
+        logging.info(f"Stored run {run_id}: {len(gateways)} gateways, {len(shares)} shares")
+        return run_id
+
+    def scopes(self):
+        """Returns every (account, region) pair that has at least one run."""
+        return self.conn.execute("SELECT DISTINCT account, region FROM runs").fetchall()
+
+    def latest_run(self, account=None, region=None, before=None):
+        """
+        Returns the newest run_id for one (account, region) scope, optionally
+        only among runs taken at or before `before`.
+        """
+        query = "SELECT run_id FROM runs WHERE account IS ? AND region IS ?"
+        params = [account, region]
+        if before is not None:
+            query += " AND taken_at <= ?"
+            params.append(before)
+        row = self.conn.execute(query + " ORDER BY taken_at DESC, run_id DESC LIMIT 1", params).fetchone()
+        return row[0] if row else None
+
+    def _latest_runs(self, scope):
+        """Latest run_id for scope, or for every scope when scope is None."""
+        scopes = [scope] if scope is not None else self.scopes()
+        return [run_id for run_id in (self.latest_run(*sc) for sc in scopes) if run_id is not None]
+
+    def _query_runs(self, query, params, run_id, scope):
+        """Runs query (ending in 'run_id = ?') against run_id or the latest run of each scope."""
+        runs = [run_id] if run_id is not None else self._latest_runs(scope)
+        rows = []
+        for run in runs:
+            rows.extend(self.conn.execute(query, list(params) + [run]).fetchall())
+        return rows
+
+    def shares_using_bucket(self, bucket, run_id=None, scope=None):
+        """
+        Returns (gateway_id, share_id, type, path) for shares backed by bucket,
+        from run_id or else the latest run of scope=(account, region), or of
+        every scope when scope is None.
+        """
+        return self._query_runs(
+            "SELECT gateway_id, share_id, type, path FROM shares WHERE bucket = ? AND run_id = ?",
+            [bucket], run_id, scope)
+
+    def shares_for_principal(self, principal, run_id=None, scope=None):
+        """Returns (share_id, access) for shares that list principal, ignoring case. Scoped like shares_using_bucket."""
+        return self._query_runs(
+            "SELECT share_id, access FROM share_principals "
+            "WHERE principal = ? COLLATE NOCASE AND run_id = ?",
+            [principal], run_id, scope)
+
+    def status_changes(self, since, to_status=None, scope=None):
+        """
+        Returns (gateway_id, name, old_status, new_status) for gateways whose
+        status changed between the last run at or before `since` (epoch
+        seconds) and the latest run of the same (account, region) scope,
+        e.g. status_changes(time.time() - 86400, 'OFFLINE'). Every scope is
+        checked when scope is None.
+        """
+        query = ("SELECT n.gateway_id, n.name, o.status, n.status FROM gateways n "
+                 "JOIN gateways o ON o.gateway_id = n.gateway_id AND o.run_id = ? "
+                 "WHERE n.run_id = ? AND n.status != o.status")
+        if to_status is not None:
+            query += " AND n.status = ?"
+        changes = []
+        for account, region in ([scope] if scope is not None else self.scopes()):
+            old_run = self.latest_run(account, region, before=since)
+            new_run = self.latest_run(account, region)
+            if old_run is None or new_run is None or old_run == new_run:
+                continue
+            params = [old_run, new_run] + ([to_status] if to_status is not None else [])
+            changes.extend(self.conn.execute(query, params).fetchall())
+        return changes
+
+class CidrIndex:
+    """
+    Index over NFS AllowedClients in a share report for "which shares admit
+    this address?" lookups. Point lookups probe one hash table per prefix
+    length in use (a flattened radix tree), so their cost doesn't depend on
+    the number of shares. Range lookups add a bisect over CIDR start
+    addresses. Shares are identified as (gateway name, share ID).
+    """
+
+    def __init__(self, share_report):
+        # {version: {prefixlen: {network >> host_bits: [share refs]}}}
+        self._prefixes = {4: {}, 6: {}}
+        # {version: sorted [(start, end, share ref)]}, used for range queries
+        self._intervals = {4: [], 6: []}
+        self.open_shares = []
+        for gw_name, entry in share_report.items():
+            for share in entry.get('Shares', []):
+                for client in share.get('AllowedClients', []):
+                    self._add(client, (gw_name, share['ShareID']))
+        for intervals in self._intervals.values():
+            intervals.sort()
+        self._starts = {v: [start for start, _, _ in iv] for v, iv in self._intervals.items()}
+
+    def _add(self, client, ref):
+        try:
+            net = ipaddress.ip_network(client.strip(), strict=False)
+        except ValueError:
+            logging.warning(f"Ignoring unparseable client entry {client!r} on share {ref[1]}")
+            return
+        if net.prefixlen == 0 and ref not in self.open_shares:
+            self.open_shares.append(ref)
+        host_bits = net.max_prefixlen - net.prefixlen
+        by_len = self._prefixes[net.version].setdefault(net.prefixlen, {})
+        by_len.setdefault(int(net.network_address) >> host_bits, []).append(ref)
+        self._intervals[net.version].append((int(net.network_address), int(net.broadcast_address), ref))
+
+    def _stab(self, version, value, max_bits):
+        found = []
+        for prefixlen, by_len in self._prefixes[version].items():
+            found.extend(by_len.get(value >> (max_bits - prefixlen), []))
+        return found
+
+    def shares_allowing(self, ip):
+        """Returns the shares whose ClientList admits the address ip."""
+        addr = ipaddress.ip_address(ip)
+        return sorted(set(self._stab(addr.version, int(addr), addr.max_prefixlen)))
+
+    def shares_overlapping(self, network):
+        """
+        Returns the shares that admit any address in network, which may be a
+        CIDR string or an (first, last) address pair.
+        """
+        if isinstance(network, tuple):
+            first, last = (ipaddress.ip_address(a) for a in network)
+        else:
+            net = ipaddress.ip_network(network, strict=False)
+            first, last = net.network_address, net.broadcast_address
+        version, lo, hi = first.version, int(first), int(last)
+        # An overlapping CIDR either contains the first address or starts inside the range
+        found = set(self._stab(version, lo, first.max_prefixlen))
+        starts, intervals = self._starts[version], self._intervals[version]
+        for i in range(bisect.bisect_left(starts, lo), bisect.bisect_right(starts, hi)):
+            found.add(intervals[i][2])
+        return sorted(found)
+
+class PrincipalIndex:
+    """
+    Inverted index from AD principal to the SMB shares that list it in
+    ValidUserList (access 'valid') or AdminUserList (access 'admin').
+    '@'-prefixed groups and plain users are kept in separate maps. Names are
+    matched case-insensitively, and DOMAIN\\user and user@domain both
+    normalise to domain\\user. Each principal is also indexed by its bare
+    name, for lookups that ignore the domain. Build one per snapshot.
+    """
+
+    def __init__(self, share_report):
+        self.users, self.groups = {}, {}
+        self._bare_users, self._bare_groups = {}, {}
+        for gw_name, entry in share_report.items():
+            for share in entry.get('Shares', []):
+                for access, field in (('valid', 'AD_AllowedUsers'), ('admin', 'AD_AdminUsers')):
+                    for principal in share.get(field, []):
+                        self._add(principal, (gw_name, share['ShareID'], access))
+
+    @staticmethod
+    def normalize(principal):
+        """Returns (is_group, 'domain\\name' or 'name', bare name), all lower-cased."""
+        name = principal.strip().lower()
+        is_group = name.startswith('@')
+        if is_group:
+            name = name[1:]
+        if '\\' in name:
+            domain, bare = name.split('\\', 1)
+        elif '@' in name:
+            bare, domain = name.rsplit('@', 1)
+        else:
+            domain, bare = None, name
+        return is_group, f"{domain}\\{bare}" if domain else bare, bare
+
+    def _add(self, principal, ref):
+        is_group, key, bare = self.normalize(principal)
+        full, by_bare = (self.groups, self._bare_groups) if is_group else (self.users, self._bare_users)
+        full.setdefault(key, set()).add(ref)
+        by_bare.setdefault(bare, set()).add(ref)
+
+    def _lookup(self, principal, any_domain, want_group):
+        is_group, key, bare = self.normalize(principal)
+        is_group = is_group or want_group
+        if any_domain:
+            refs = (self._bare_groups if is_group else self._bare_users).get(bare, set())
+        else:
+            refs = (self.groups if is_group else self.users).get(key, set())
+        return sorted(refs)
+
+    def shares_for_user(self, user, any_domain=False):
+        """Returns (gateway name, share ID, access) for each share listing user."""
+        return self._lookup(user, any_domain, want_group=False)
+
+    def shares_for_group(self, group, any_domain=False):
+        """Returns (gateway name, share ID, access) for each share listing group (with or without '@')."""
+        return self._lookup(group, any_domain, want_group=True)
+
+    def shares_for_leavers(self, principals, any_domain=False):
+        """Maps each principal in a leavers list to its shares, omitting principals with none."""
+        results = {}
+        for principal in principals:
+            refs = self._lookup(principal, any_domain, want_group=False)
+            if refs:
+                results[principal] = refs
+        return results
+
+class GatewayWatcher:
+    """
+    Long-running watch mode. Gateway status, shares and metrics are polled
+    on their own intervals by a small heap-based scheduler. Each run is
+    rescheduled with +/- jitter so polls from many watchers don't line up.
+    The manager, its pooled clients, the response cache and the incremental
+    share state are all kept between cycles. Change events and anomalies
+    are appended to events_file as NDJSON. SIGTERM/SIGINT stop the loop
+    after the task in progress finishes.
+    """
+
+    def __init__(self, manager, status_interval=60, share_interval=900, metric_interval=300,
+                 jitter=0.1, output='comprehensive_shares.json', events_file='gateway_events.ndjson'):
+        self.manager = manager
+        if manager.cache is None:
+            manager.cache = ResponseCache()
+        self.intervals = {'status': status_interval, 'shares': share_interval, 'metrics': metric_interval}
+        self.jitter = jitter
+        self.output = output
+        self.events_file = events_file
+        self.stop_event = threading.Event()
+        self.gateways = []
+        self.share_report = {}
+        self.share_state = None
+        self.collector = None
+        self.detector = None
+
+    def _next_delay(self, task):
+        interval = self.intervals[task]
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _emit(self, events):
+        if not events:
+            return
+        with open(self.events_file, 'a') as f:
+            for event in events:
+                f.write(json.dumps({'Time': datetime.now(timezone.utc).isoformat(), **event}, default=str) + '\n')
+        logging.info(f"Recorded {len(events)} events to {self.events_file}")
+
+    def poll_status(self):
+        gateways = self.manager.get_detailed_status(shallow=True)
+        if self.gateways:
+            events = list(diff_snapshots(self.gateways, {}, gateways, {}))
+            self._emit(events)
+            # Cached share/volume listings for a gateway that changed state are no longer trustworthy
+            arns = {gw['ID']: gw['ARN'] for gw in self.gateways + gateways}
+            for event in events:
+                if event['Event'] in ('GatewayStateChanged', 'GatewayRemoved'):
+                    self.manager.invalidate_gateway(arns[event['GatewayID']])
+        self.gateways = gateways
+
+    def poll_shares(self):
+        share_report, self.share_state, _ = self.manager.refresh_inventory_report(self.share_state)
+        if self.share_report:
+            self._emit(list(diff_snapshots([], self.share_report, [], share_report)))
+        self.share_report = share_report
+        with open(self.output, 'w') as f:
             json.dump(share_report, f, indent=4)
-        logging.info(f"Detailed share report saved to {filename}")
+
+    def poll_metrics(self):
+        if not self.gateways:
+            self.poll_status()
+        if self.collector is None:
+            self.collector = MetricCollector(region_name=self.manager.region, account=self.manager.account)
+            self.detector = AnomalyDetector()
+        end = datetime.now(timezone.utc)
+        timestamps, data = self.collector.collect(self.gateways, start=end - timedelta(minutes=30), end=end)
+        self._emit([{'Event': 'MetricAnomaly', **a} for a in self.detector.update_from_collection(timestamps, data)])
+
+    def _handle_signal(self, signum, frame):
+        logging.info(f"Received signal {signum}, stopping after the current task")
+        self.stop_event.set()
+
+    def run(self):
+        """Runs until SIGTERM/SIGINT (or stop_event is set)."""
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._handle_signal)
+        tasks = {'status': self.poll_status, 'shares': self.poll_shares, 'metrics': self.poll_metrics}
+        # Stagger the first runs so the three pollers don't all start at once
+        now = time.monotonic()
+        schedule = [(now + random.uniform(0, self.jitter * interval), task)
+                    for task, interval in self.intervals.items() if interval]
+        heapq.heapify(schedule)
+        while schedule and not self.stop_event.is_set():
+            due, task = heapq.heappop(schedule)
+            if self.stop_event.wait(max(0.0, due - time.monotonic())):
+                break
+            started = time.monotonic()
+            try:
+                tasks[task]()
+            except Exception as e:
+                logging.error(f"Watch task {task} failed: {e}")
+            logging.info(f"Watch task {task} finished in {time.monotonic() - started:.1f}s")
+            heapq.heappush(schedule, (started + self._next_delay(task), task))
+        logging.info("Watch mode stopped")
 
 if __name__ == "__main__":
-    sg_mgr = StorageGatewayManager(region_name='us-east-1')
-    sg_mgr.export_shares_to_json('comprehensive_shares.json')
+    parser = argparse.ArgumentParser(description="Report Storage Gateway status and shares.")
+    parser.add_argument('--region', default='us-east-1')
+    parser.add_argument('--all-regions', action='store_true', help="inventory every enabled region")
+    parser.add_argument('--regions', nargs='+', help="inventory these regions in parallel")
+    parser.add_argument('--workers', type=int, default=16, help="concurrent API calls per region")
+    parser.add_argument('--accounts', nargs='+', help="assume --role-name in each of these accounts")
+    parser.add_argument('--role-name', default='StorageGatewayInventory')
+    parser.add_argument('--account-timeout', type=int, default=900, help="seconds before an account is abandoned")
+    parser.add_argument('--output', default='comprehensive_shares.json')
+    # Output modes are mutually exclusive and only supported for a single region/account
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--ndjson', action='store_true', help="stream one JSON record per line")
+    mode.add_argument('--csv', action='store_true', help="stream a flat one-row-per-share CSV")
+    mode.add_argument('--incremental', metavar='STATE_FILE',
+                      help="only re-describe shares that changed since the run that wrote STATE_FILE")
+    mode.add_argument('--sqlite', metavar='PATH', help="also record the run (gateways and shares) in this SQLite snapshot store")
+    mode.add_argument('--parquet', action='store_true',
+                      help="write <output>.gateways.parquet and <output>.shares.parquet (needs pyarrow)")
+    mode.add_argument('--watch', action='store_true', help="keep running and poll on the intervals below")
+    parser.add_argument('--explode', action='store_true', help="with --csv, one row per client/user entry")
+    parser.add_argument('--status-interval', type=int, default=60)
+    parser.add_argument('--share-interval', type=int, default=900)
+    parser.add_argument('--metric-interval', type=int, default=300, help="0 disables metric polling")
+    parser.add_argument('--events', default='gateway_events.ndjson', help="watch mode change/anomaly log")
+    args = parser.parse_args()
+    single_only = [flag for flag, used in (('--ndjson', args.ndjson), ('--csv', args.csv),
+                                           ('--incremental', args.incremental), ('--sqlite', args.sqlite),
+                                           ('--parquet', args.parquet), ('--watch', args.watch)) if used]
+    if single_only and (args.accounts or args.regions or args.all_regions):
+        parser.error(f"{single_only[0]} only supports a single --region, not --regions/--all-regions/--accounts")
+    if args.explode and not args.csv:
+        parser.error("--explode requires --csv")
+
+    if args.accounts:
+        regions = args.regions or (MultiRegionManager.discover_regions() if args.all_regions else [args.region])
+        sg_mgr = MultiAccountManager(args.accounts, role_name=args.role_name, regions=regions,
+                                     max_workers_per_region=args.workers, account_timeout=args.account_timeout)
+    elif args.all_regions or args.regions:
+        sg_mgr = MultiRegionManager(regions=args.regions, max_workers=args.workers)
+    else:
+        sg_mgr = StorageGatewayManager(region_name=args.region, max_workers=args.workers)
+    if args.watch:
+        GatewayWatcher(sg_mgr, status_interval=args.status_interval, share_interval=args.share_interval,
+                       metric_interval=args.metric_interval, output=args.output,
+                       events_file=args.events).run()
+    elif args.incremental:
+        sg_mgr.export_shares_incremental(args.output, args.incremental)
+    elif args.sqlite:
+        gateways = sg_mgr.get_detailed_status()
+        share_report = sg_mgr.collect_inventory_report(gateways)
+        store = SnapshotStore(args.sqlite)
+        store.write_run(gateways, share_report, region=sg_mgr.region)
+        store.close()
+        with open(args.output, 'w') as f:
+            json.dump(share_report, f, indent=4)
+        logging.info(f"Detailed share report saved to {args.output}")
+    elif args.parquet:
+        sg_mgr.export_snapshot_to_parquet(f"{args.output}.gateways.parquet", f"{args.output}.shares.parquet")
+    elif args.csv:
+        sg_mgr.export_shares_to_csv(args.output, explode=args.explode)
+    elif args.ndjson:
+        sg_mgr.export_shares_to_ndjson(args.output)
+    else:
+        sg_mgr.export_shares_to_json(args.output)
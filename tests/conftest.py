@@ -0,0 +1,5 @@
+import os
+import sys
+
+# AWS_SG_MGR.py is a single script at the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,238 @@
+"""In-memory stand-ins for the boto3 clients, so the managers can be tested without AWS."""
+from datetime import timedelta
+
+import boto3
+from botocore.exceptions import ClientError
+
+from AWS_SG_MGR import AdaptiveRateLimiter
+
+# The real client's metadata drives Marker/NextMarker detection; no call is ever sent
+_META = boto3.client('storagegateway', region_name='us-east-1',
+                     aws_access_key_id='testing', aws_secret_access_key='testing').meta
+
+
+def client_error(code, operation='Call', status=400):
+    return ClientError({'Error': {'Code': code, 'Message': code},
+                        'ResponseMetadata': {'HTTPStatusCode': status}}, operation)
+
+
+def gateway(i, gateway_type='FILE_S3', state='ACTIVE'):
+    return {'GatewayARN': f'arn:aws:storagegateway:us-east-1:111122223333:gateway/sgw-{i:03d}',
+            'GatewayId': f'sgw-{i:03d}', 'GatewayName': f'gw{i}', 'GatewayType': gateway_type,
+            'GatewayOperationalState': state, 'SoftwareVersion': '2.0'}
+
+
+class StubClient:
+    """Answers the Storage Gateway calls the manager makes from in-memory data and records each call."""
+    meta = _META
+
+    def __init__(self, gateways, shares=None, page_size=2):
+        self.gateways = gateways
+        self.shares = shares or {}  # {gateway ARN: [(share ID, 'NFS' or 'SMB')]}
+        self.share_status = {}  # {share ARN: FileShareStatus}, AVAILABLE when missing
+        self.volumes = {}  # {gateway ARN: volume count}
+        self.tapes = {}  # {gateway ARN: tape count}
+        self.archived_tapes = 0
+        self.associations = {}  # {gateway ARN: association count}
+        self.failing_caches = set()  # gateway ARNs whose describe_cache fails
+        self.page_size = page_size
+        self.calls = []
+
+    def _page(self, items, marker):
+        start = int(marker or 0)
+        end = start + self.page_size
+        return items[start:end], (str(end) if end < len(items) else None)
+
+    def list_gateways(self, Marker=None):
+        self.calls.append(('list_gateways', Marker))
+        page, marker = self._page(self.gateways, Marker)
+        return {'Gateways': page, **({'Marker': marker} if marker else {})}
+
+    def describe_gateway_information(self, GatewayARN):
+        self.calls.append(('describe_gateway_information', GatewayARN))
+        gw = next(gw for gw in self.gateways if gw['GatewayARN'] == GatewayARN)
+        return {'GatewayARN': GatewayARN, 'GatewayId': gw['GatewayId'], 'GatewayName': gw['GatewayName'],
+                'GatewayType': gw['GatewayType'], 'GatewayState': 'RUNNING', 'GatewayTimezone': 'GMT'}
+
+    def list_file_shares(self, GatewayARN, Marker=None):
+        # ListFileShares echoes the request Marker and returns the next one as NextMarker
+        self.calls.append(('list_file_shares', Marker))
+        infos = [{'FileShareARN': f'{GatewayARN}/{share_id}', 'FileShareId': share_id, 'FileShareType': share_type,
+                  'FileShareStatus': self.share_status.get(f'{GatewayARN}/{share_id}', 'AVAILABLE'),
+                  'GatewayARN': GatewayARN}
+                 for share_id, share_type in self.shares.get(GatewayARN, [])]
+        page, marker = self._page(infos, Marker)
+        return {'FileShareInfoList': page, 'Marker': Marker or '', **({'NextMarker': marker} if marker else {})}
+
+    def _describe(self, arns):
+        return [{'FileShareARN': arn, 'FileShareId': arn.rsplit('/', 1)[1], 'GatewayARN': arn.rsplit('/', 1)[0],
+                 'Path': '/data', 'LocationARN': 'arn:aws:s3:::bucket',
+                 'FileShareStatus': self.share_status.get(arn, 'AVAILABLE'),
+                 'ClientList': ['10.0.0.0/8'], 'ValidUserList': ['@Staff']} for arn in arns]
+
+    def describe_nfs_file_shares(self, FileShareARNList):
+        self.calls.append(('describe_nfs_file_shares', list(FileShareARNList)))
+        return {'NFSFileShareInfoList': self._describe(FileShareARNList)}
+
+    def describe_smb_file_shares(self, FileShareARNList):
+        self.calls.append(('describe_smb_file_shares', list(FileShareARNList)))
+        return {'SMBFileShareInfoList': self._describe(FileShareARNList)}
+
+    def list_volumes(self, GatewayARN, Marker=None):
+        self.calls.append(('list_volumes', Marker))
+        arns = [{'VolumeARN': f'{GatewayARN}/volume/vol-{i:03d}', 'GatewayARN': GatewayARN}
+                for i in range(self.volumes.get(GatewayARN, 0))]
+        page, marker = self._page(arns, Marker)
+        return {'VolumeInfos': page, **({'Marker': marker} if marker else {})}
+
+    def _describe_volumes(self, arns):
+        return [{'VolumeARN': arn, 'VolumeId': arn.rsplit('/', 1)[1], 'VolumeStatus': 'AVAILABLE',
+                 'VolumeSizeInBytes': 100, 'VolumeUsedInBytes': 40, 'VolumeDiskId': 'disk-0',
+                 'VolumeiSCSIAttributes': {'TargetARN': f'{arn}/target', 'NetworkInterfaceId': '10.0.0.5'}}
+                for arn in arns]
+
+    def describe_cached_iscsi_volumes(self, VolumeARNs):
+        self.calls.append(('describe_cached_iscsi_volumes', list(VolumeARNs)))
+        return {'CachediSCSIVolumes': self._describe_volumes(VolumeARNs)}
+
+    def describe_stored_iscsi_volumes(self, VolumeARNs):
+        self.calls.append(('describe_stored_iscsi_volumes', list(VolumeARNs)))
+        return {'StorediSCSIVolumes': self._describe_volumes(VolumeARNs)}
+
+    def _tape_arn(self, gateway_arn, i):
+        return f"arn:aws:storagegateway:us-east-1:111122223333:tape/{gateway_arn.rsplit('/', 1)[1]}-{i:03d}"
+
+    def list_tapes(self, Marker=None):
+        self.calls.append(('list_tapes', Marker))
+        infos = [{'TapeARN': self._tape_arn(gw_arn, i), 'GatewayARN': gw_arn}
+                 for gw_arn, count in self.tapes.items() for i in range(count)]
+        page, marker = self._page(infos, Marker)
+        return {'TapeInfos': page, **({'Marker': marker} if marker else {})}
+
+    def describe_tapes(self, GatewayARN, TapeARNs):
+        self.calls.append(('describe_tapes', list(TapeARNs)))
+        return {'Tapes': [{'TapeARN': arn, 'TapeBarcode': arn.rsplit('-', 1)[1], 'TapeStatus': 'AVAILABLE',
+                           'TapeSizeInBytes': 1000, 'VTLDevice': 'dev-0'} for arn in TapeARNs]}
+
+    def describe_tape_archives(self, Marker=None):
+        self.calls.append(('describe_tape_archives', Marker))
+        archives = [{'TapeARN': f'arn:aws:storagegateway:us-east-1:111122223333:tape/ARCH{i:03d}',
+                     'TapeBarcode': f'ARCH{i:03d}', 'TapeStatus': 'ARCHIVED'} for i in range(self.archived_tapes)]
+        page, marker = self._page(archives, Marker)
+        return {'TapeArchives': page, **({'Marker': marker} if marker else {})}
+
+    def list_file_system_associations(self, GatewayARN, Marker=None):
+        self.calls.append(('list_file_system_associations', Marker))
+        summaries = [{'FileSystemAssociationARN': f'{GatewayARN}/fs-association/fsa-{i:03d}', 'GatewayARN': GatewayARN}
+                     for i in range(self.associations.get(GatewayARN, 0))]
+        page, marker = self._page(summaries, Marker)
+        return {'FileSystemAssociationSummaryList': page, 'Marker': Marker or '',
+                **({'NextMarker': marker} if marker else {})}
+
+    def describe_file_system_associations(self, FileSystemAssociationARNList):
+        self.calls.append(('describe_file_system_associations', list(FileSystemAssociationARNList)))
+        return {'FileSystemAssociationInfoList': [
+            {'FileSystemAssociationARN': arn, 'GatewayARN': arn.split('/fs-association/')[0],
+             'LocationARN': 'arn:aws:fsx:us-east-1:111122223333:file-system/fs-1',
+             'FileSystemAssociationStatus': 'AVAILABLE', 'CacheAttributes': {'CacheStaleTimeoutInSeconds': 300},
+             'EndpointNetworkConfiguration': {'IpAddresses': ['10.0.0.9']}}
+            for arn in FileSystemAssociationARNList]}
+
+    def describe_cache(self, GatewayARN):
+        self.calls.append(('describe_cache', GatewayARN))
+        if GatewayARN in self.failing_caches:
+            raise client_error('InvalidGatewayRequestException', 'DescribeCache')
+        return {'GatewayARN': GatewayARN, 'CacheAllocatedInBytes': 1000, 'CacheDirtyPercentage': 25.0,
+                'CacheUsedPercentage': 60.0}
+
+    def describe_upload_buffer(self, GatewayARN):
+        self.calls.append(('describe_upload_buffer', GatewayARN))
+        return {'GatewayARN': GatewayARN, 'UploadBufferAllocatedInBytes': 200, 'UploadBufferUsedInBytes': 50}
+
+    def operations(self, prefix=''):
+        return [op for op, _ in self.calls if op.startswith(prefix)]
+
+
+class StubCloudWatch:
+    """
+    Answers get_metric_data with one datapoint per period: the query's
+    gateway number plus the slot number. Results are paged page_size at a
+    time through NextToken.
+    """
+
+    def __init__(self, page_size=300, missing=()):
+        self.page_size = page_size
+        self.missing = set(missing)  # gateway IDs that have no datapoints
+        self.calls = []
+
+    def get_metric_data(self, MetricDataQueries, StartTime, EndTime, ScanBy, NextToken=None):
+        self.calls.append((len(MetricDataQueries), NextToken))
+        start = int(NextToken or 0)
+        results = []
+        for query in MetricDataQueries[start:start + self.page_size]:
+            stat = query['MetricStat']
+            gateway_id = stat['Metric']['Dimensions'][0]['Value']
+            times = [] if gateway_id in self.missing else \
+                [StartTime + timedelta(seconds=k * stat['Period']) for k in range(3)]
+            results.append({'Id': query['Id'], 'Timestamps': times,
+                            'Values': [float(gateway_id.rsplit('-', 1)[1]) + k for k in range(len(times))]})
+        end = start + self.page_size
+        return {'MetricDataResults': results, **({'NextToken': str(end)} if end < len(MetricDataQueries) else {})}
+
+
+class _AsyncPaginator:
+    def __init__(self, client, operation):
+        self.client = client
+        self.operation = operation
+
+    async def _pages(self, kwargs):
+        output_shape = _META.service_model.operation_model(_META.method_to_api_mapping[self.operation]).output_shape
+        next_key = 'NextMarker' if 'NextMarker' in output_shape.members else 'Marker'
+        marker = None
+        while True:
+            page = getattr(self.client, self.operation)(**kwargs, **({'Marker': marker} if marker else {}))
+            yield page
+            marker = page.get(next_key)
+            if not marker:
+                return
+
+    def paginate(self, **kwargs):
+        return self._pages(kwargs)
+
+
+class AsyncStubClient:
+    """Exposes a StubClient through the coroutine interface aiobotocore clients have."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_paginator(self, operation):
+        return _AsyncPaginator(self.client, operation)
+
+    def __getattr__(self, operation):
+        method = getattr(self.client, operation)
+
+        async def call(**kwargs):
+            return method(**kwargs)
+        return call
+
+
+class StubFactory:
+    """Hands every manager the same stub client and a fast limiter."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_client(self, service, region_name, **kwargs):
+        return self.client
+
+    def get_limiter(self, account, region_name):
+        return AdaptiveRateLimiter(initial_rate=1000.0, max_rate=1000.0, base_delay=0.001)
+
+
+def file_fleet(gateway_count=3, nfs=2, smb=1, extra_gateways=()):
+    """A stub client with gateway_count FILE_S3 gateways, each with nfs NFS and smb SMB shares."""
+    gateways = [gateway(i) for i in range(gateway_count)] + list(extra_gateways)
+    shares = {gw['GatewayARN']: [(f'nfs-{i}', 'NFS') for i in range(nfs)] + [(f'smb-{i}', 'SMB') for i in range(smb)]
+              for gw in gateways[:gateway_count]}
+    return StubClient(gateways, shares)
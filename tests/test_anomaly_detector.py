@@ -0,0 +1,66 @@
+import warnings
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from AWS_SG_MGR import AnomalyDetector
+
+
+def test_welford_matches_batch_statistics():
+    values = [3.0, 7.0, 1.0, 9.0, 4.0, 6.0]
+    detector = AnomalyDetector(metrics=['m'], mode='welford', warmup=100)
+    for value in values:
+        detector.update({'gw': {'m': value}})
+    assert detector.count[0, 0] == len(values)
+    assert detector.mean[0, 0] == pytest.approx(np.mean(values))
+    assert detector._std(np.array([0]))[0, 0] == pytest.approx(np.std(values, ddof=1))
+
+
+def test_ewma_update():
+    detector = AnomalyDetector(metrics=['m'], mode='ewma', alpha=0.5, warmup=100)
+    detector.update({'gw': {'m': 10.0}})
+    detector.update({'gw': {'m': 20.0}})
+    # mean += alpha * delta; var = (1 - alpha) * (var + delta * alpha * delta)
+    assert detector.mean[0, 0] == pytest.approx(15.0)
+    assert detector.var[0, 0] == pytest.approx(25.0)
+
+
+def test_anomaly_flagged_after_warmup():
+    detector = AnomalyDetector(metrics=['m'], mode='welford', warmup=5, threshold=3.0)
+    for value in [10.0, 11.0, 9.0, 10.0, 11.0, 9.0]:
+        assert detector.update({'gw': {'m': value}, 'other': {'m': None}}) == []
+    anomalies = detector.update({'gw': {'m': 50.0}})
+    assert [(a['GatewayID'], a['Metric'], a['Value']) for a in anomalies] == [('gw', 'm', 50.0)]
+    assert anomalies[0]['ZScore'] > 3.0
+
+
+def test_state_grows_past_its_capacity():
+    detector = AnomalyDetector(metrics=['m'], mode='welford', capacity=2)
+    detector.update({f'gw{i}': {'m': float(i)} for i in range(5)})
+    assert detector.count.shape[0] >= 5
+    assert detector.mean[detector.rows['gw4'], 0] == 4.0
+
+
+def test_update_from_collection_absorbs_each_datapoint_once():
+    detector = AnomalyDetector(metrics=['m'], mode='welford', warmup=100)
+    timestamps = np.array(['2026-01-01T00:00', '2026-01-01T00:05', '2026-01-01T00:10'], dtype='datetime64[s]')
+    detector.update_from_collection(timestamps, {'gw': {'m': np.array([1.0, 2.0, np.nan])}})
+    assert detector.count[0, 0] == 2
+    # The next, overlapping window repeats two datapoints and adds one
+    detector.update_from_collection(timestamps + np.timedelta64(5, 'm'), {'gw': {'m': np.array([2.0, 3.0, 4.0])}})
+    assert detector.count[0, 0] == 4
+    assert detector.mean[0, 0] == pytest.approx(np.mean([1.0, 2.0, 3.0, 4.0]))
+
+
+def test_timezone_aware_timestamps():
+    detector = AnomalyDetector(metrics=['m'], mode='welford', warmup=100)
+    now = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        detector.update({'gw': {'m': 1.0}}, now)
+        detector.update({'gw': {'m': 2.0}}, now)  # same instant: skipped
+        detector.update({'gw': {'m': 3.0}}, now.astimezone(timezone(timedelta(hours=-5))))  # same instant again
+        detector.update({'gw': {'m': 4.0}}, np.datetime64('2026-01-01T12:05:00'))
+    assert detector.count[0, 0] == 2
+    assert detector.last_seen[0, 0] == int(datetime(2026, 1, 1, 12, 5, tzinfo=timezone.utc).timestamp())
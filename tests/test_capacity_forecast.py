@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from AWS_SG_MGR import StorageGatewayManager, _series_fit, forecast_capacity
+from stubs import StubClient, StubFactory, gateway
+
+
+def test_series_fit_ignores_nans():
+    x = np.arange(6, dtype='float64')
+    y = np.array([
+        2.0 * x + 1.0,
+        [np.nan, 3.0, np.nan, 7.0, 9.0, np.nan],  # same line with gaps
+        [np.nan, np.nan, np.nan, 4.0, np.nan, np.nan],  # a single point can't be fitted
+    ])
+    slope, intercept = _series_fit(x, y)
+    assert slope[:2] == pytest.approx([2.0, 2.0])
+    assert intercept[:2] == pytest.approx([1.0, 1.0])
+    assert np.isnan(slope[2]) and np.isnan(intercept[2])
+
+
+def test_forecast_capacity_days_to_full():
+    now = datetime(2026, 1, 11, tzinfo=timezone.utc)
+    timestamps = np.arange('2026-01-01', '2026-01-11', dtype='datetime64[D]').astype('datetime64[s]')
+    days = np.arange(-10, 0, dtype='float64')
+    data = {
+        'rising': {'CachePercentDirty': 50.0 + 5.0 * days},  # 50% now, +5/day -> full in 10 days
+        'falling': {'CachePercentDirty': 50.0 - days},
+        'full': {'CachePercentDirty': np.full(10, 100.0)},
+    }
+    result = forecast_capacity(timestamps, data, now=now)
+    assert result['SlopePerDay'][0] == pytest.approx(5.0)
+    assert result['Current'][0] == pytest.approx(50.0)
+    assert result['DaysToFull'] == pytest.approx([10.0, np.inf, 0.0])
+    assert result['FullAt'][0] == np.datetime64('2026-01-21T00:00:00')
+    assert np.isnat(result['FullAt'][1])
+
+
+def test_forecast_uses_a_current_sample():
+    now = datetime(2026, 1, 11, tzinfo=timezone.utc)
+    timestamps = np.arange('2026-01-01', '2026-01-11', dtype='datetime64[D]').astype('datetime64[s]')
+    data = {'gw': {'CachePercentDirty': np.full(10, np.nan)}}
+    data['gw']['CachePercentDirty'][0] = 0.0  # 10 days ago
+    result = forecast_capacity(timestamps, data, current={'gw': {'CachePercentDirty': 50.0}}, now=now)
+    assert result['SlopePerDay'][0] == pytest.approx(5.0)
+    assert result['DaysToFull'][0] == pytest.approx(10.0)
+
+
+def test_capacity_sampling_counts_failures():
+    gateways = [gateway(0, 'CACHED'), gateway(1, 'FILE_S3'), gateway(2, 'STORED')]
+    client = StubClient(gateways)
+    client.failing_caches = {gateways[1]['GatewayARN']}
+    manager = StorageGatewayManager(factory=StubFactory(client))
+    records = manager.get_detailed_status(shallow=True)
+
+    samples = manager.sample_capacity(records)
+    assert samples['sgw-000'] == {'CachePercentDirty': 25.0, 'CachePercentUsed': 60.0,
+                                  'UploadBufferPercentUsed': 25.0}
+    assert samples['sgw-002'] == {'UploadBufferPercentUsed': 25.0}
+    assert 'sgw-001' not in samples
+    assert manager.error_count == 1
+
+    assert manager.get_cache_sizes(records) == {'sgw-000': 1000}
+    assert manager.error_count == 2
@@ -0,0 +1,37 @@
+from AWS_SG_MGR import CidrIndex
+
+REPORT = {
+    'gw-a': {'GatewayID': 'sgw-a', 'Shares': [
+        {'ShareID': 'share-1', 'Type': 'NFS', 'AllowedClients': ['10.0.0.0/8']},
+        {'ShareID': 'share-2', 'Type': 'NFS', 'AllowedClients': ['10.1.2.0/24', '192.168.1.5']},
+        {'ShareID': 'share-3', 'Type': 'NFS', 'AllowedClients': ['0.0.0.0/0', 'not-an-ip']},
+        {'ShareID': 'share-4', 'Type': 'NFS', 'AllowedClients': ['2001:db8::/32']},
+    ]},
+    'gw-b': {'GatewayID': 'sgw-b', 'Shares': [{'ShareID': 'share-5', 'Type': 'SMB', 'AD_AllowedUsers': ['bob']}]},
+    'vol-gw': {'GatewayID': 'sgw-v', 'Volumes': []},
+}
+
+
+def test_cidr_containment():
+    index = CidrIndex(REPORT)
+    assert index.shares_allowing('10.1.2.3') == [('gw-a', 'share-1'), ('gw-a', 'share-2'), ('gw-a', 'share-3')]
+    assert index.shares_allowing('10.9.9.9') == [('gw-a', 'share-1'), ('gw-a', 'share-3')]
+    assert index.shares_allowing('192.168.1.5') == [('gw-a', 'share-2'), ('gw-a', 'share-3')]
+    assert index.shares_allowing('192.168.1.6') == [('gw-a', 'share-3')]
+    assert index.shares_allowing('2001:db8::1') == [('gw-a', 'share-4')]
+    assert index.shares_allowing('2001:db9::1') == []
+
+
+def test_cidr_overlap():
+    index = CidrIndex(REPORT)
+    # A /16 inside 10/8 that contains the /24
+    assert index.shares_overlapping('10.1.0.0/16') == [('gw-a', 'share-1'), ('gw-a', 'share-2'),
+                                                       ('gw-a', 'share-3')]
+    # A supernet that starts before every entry still finds them by start address
+    assert ('gw-a', 'share-2') in index.shares_overlapping(('192.168.0.0', '192.168.255.255'))
+    assert index.shares_overlapping('2001:db8:1::/48') == [('gw-a', 'share-4')]
+    assert index.shares_overlapping('::/0') == [('gw-a', 'share-4')]
+
+
+def test_cidr_open_shares():
+    assert CidrIndex(REPORT).open_shares == [('gw-a', 'share-3')]
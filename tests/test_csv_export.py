@@ -0,0 +1,47 @@
+import csv
+
+from AWS_SG_MGR import StorageGatewayManager
+from stubs import StubFactory, file_fleet
+
+
+def read_rows(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_one_row_per_share_with_joined_lists(tmp_path):
+    client = file_fleet(gateway_count=2, nfs=2, smb=1)
+    manager = StorageGatewayManager(factory=StubFactory(client))
+    path = tmp_path / 'shares.csv'
+    manager.export_shares_to_csv(str(path))
+    rows = read_rows(path)
+    assert len(rows) == 6
+    assert list(rows[0]) == StorageGatewayManager.CSV_COLUMNS
+    nfs = next(r for r in rows if r['Type'] == 'NFS')
+    assert (nfs['Gateway'], nfs['AllowedClients'], nfs['AD_AllowedUsers']) == ('gw0', '10.0.0.0/8', '')
+    smb = next(r for r in rows if r['Type'] == 'SMB')
+    assert (smb['AD_AllowedUsers'], smb['SMB_ACL_Enabled']) == ('@Staff', 'False')
+
+
+def test_explode_writes_one_row_per_entry_without_list_columns(tmp_path):
+    client = file_fleet(gateway_count=1, nfs=1, smb=0)
+    manager = StorageGatewayManager(factory=StubFactory(client))
+    clients = [f'10.0.{i}.0/24' for i in range(50)]
+    client._describe = lambda arns: [{'FileShareARN': arn, 'FileShareId': 'nfs-0', 'ClientList': clients}
+                                     for arn in arns]
+    path = tmp_path / 'exploded.csv'
+    manager.export_shares_to_csv(str(path), explode=True)
+    rows = read_rows(path)
+    assert len(rows) == 50
+    assert 'AllowedClients' not in rows[0]
+    assert [(r['EntryType'], r['Entry']) for r in rows[:2]] == [('AllowedClient', '10.0.0.0/24'),
+                                                                  ('AllowedClient', '10.0.1.0/24')]
+    # Output grows linearly with the number of entries, not quadratically
+    assert path.stat().st_size < 50 * 200
+
+
+def test_explode_blanks_list_columns_that_are_requested(tmp_path):
+    manager = StorageGatewayManager(factory=StubFactory(file_fleet(gateway_count=1, nfs=1, smb=0)))
+    path = tmp_path / 'exploded.csv'
+    manager.export_shares_to_csv(str(path), columns=['ShareID', 'AllowedClients', 'Entry'], explode=True)
+    assert read_rows(path) == [{'ShareID': 'nfs-0', 'AllowedClients': '', 'Entry': '10.0.0.0/8'}]
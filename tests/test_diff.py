@@ -0,0 +1,43 @@
+from AWS_SG_MGR import diff_snapshots
+
+
+def gateway(gw_id, status='RUNNING'):
+    return {'ID': gw_id, 'Name': f'name-{gw_id}', 'Status': status, 'Type': 'FILE_S3', 'ARN': f'arn:{gw_id}'}
+
+
+def share(share_id, status='AVAILABLE', clients=(), users=()):
+    return {'ShareID': share_id, 'Type': 'NFS', 'Path': f'/{share_id}', 'Status': status,
+            'AllowedClients': list(clients), 'AD_AllowedUsers': list(users)}
+
+
+def test_gateway_events():
+    old = [gateway('sgw-1'), gateway('sgw-2')]
+    new = [gateway('sgw-2', status='SHUTDOWN'), gateway('sgw-3')]
+    events = {e['Event']: e for e in diff_snapshots(old, {}, new, {})}
+    assert events['GatewayRemoved']['GatewayID'] == 'sgw-1'
+    assert events['GatewayAdded'] == {'Event': 'GatewayAdded', 'GatewayID': 'sgw-3', 'Name': 'name-sgw-3',
+                                      'Status': 'RUNNING'}
+    assert (events['GatewayStateChanged']['From'], events['GatewayStateChanged']['To']) == ('RUNNING', 'SHUTDOWN')
+
+
+def test_share_events():
+    old = {'gw': {'GatewayID': 'sgw-1', 'Shares': [
+        share('s1', clients=['10.0.0.0/8', '10.1.0.0/16']), share('s2'), share('s3', users=['bob'])]}}
+    new = {'gw': {'GatewayID': 'sgw-1', 'Shares': [
+        share('s1', clients=['10.1.0.0/16', '172.16.0.0/12']), share('s2', status='UNAVAILABLE'),
+        share('s4')]},
+        'vol': {'GatewayID': 'sgw-2', 'Volumes': []}}
+    events = sorted(diff_snapshots([], old, [], new), key=lambda e: (e['ShareID'], e['Event']))
+    assert events == [
+        {'Event': 'ClientListChanged', 'GatewayID': 'sgw-1', 'ShareID': 's1',
+         'Added': ['172.16.0.0/12'], 'Removed': ['10.0.0.0/8']},
+        {'Event': 'ShareStatusChanged', 'GatewayID': 'sgw-1', 'ShareID': 's2',
+         'From': 'AVAILABLE', 'To': 'UNAVAILABLE'},
+        {'Event': 'ShareRemoved', 'GatewayID': 'sgw-1', 'ShareID': 's3'},
+        {'Event': 'ShareAdded', 'GatewayID': 'sgw-1', 'ShareID': 's4', 'Type': 'NFS', 'Path': '/s4'},
+    ]
+
+
+def test_unchanged_snapshot_has_no_events():
+    report = {'gw': {'GatewayID': 'sgw-1', 'Shares': [share('s1', clients=['10.0.0.0/8'])]}}
+    assert list(diff_snapshots([gateway('sgw-1')], report, [gateway('sgw-1')], report)) == []
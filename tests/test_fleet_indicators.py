@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from AWS_SG_MGR import attach_indicators, fleet_indicators
+
+TIMESTAMPS = np.arange('2026-01-01T00:00', '2026-01-01T01:00', np.timedelta64(5, 'm'), dtype='datetime64[s]')
+
+
+def series(dirty, uploaded, hits=90.0):
+    n = len(TIMESTAMPS)
+    return {'CachePercentDirty': np.full(n, dirty) if np.isscalar(dirty) else dirty,
+            'CacheHitPercent': np.full(n, hits), 'CloudBytesUploaded': np.full(n, uploaded)}
+
+
+def test_backlog_eta():
+    data = {'ok': series(50.0, 300e6), 'stalled': series(50.0, 0.0), 'unknown': series(50.0, np.nan),
+            'clean': series(0.0, np.nan), 'no-size': series(50.0, 0.0)}
+    sizes = {g: 1e9 for g in ('ok', 'stalled', 'unknown', 'clean')}
+    result = fleet_indicators(TIMESTAMPS, data, sizes)
+    eta = result['BacklogEtaSeconds']
+    # 500 MB dirty at 1 MB/s
+    assert result['UploadBytesPerSec'][0] == pytest.approx(1e6)
+    assert eta[0] == pytest.approx(500.0)
+    assert eta[1] == np.inf
+    assert np.isnan(eta[2]) and np.isnan(eta[4])
+    assert eta[3] == 0.0
+    # Only the stalled gateway gets the backlog point
+    assert result['Risk'] == pytest.approx([0.5, 1.5, 0.5, 0.0, 0.5])
+
+
+def test_dirty_trend_and_risk_ordering():
+    rising = np.linspace(10.0, 65.0, len(TIMESTAMPS))  # 60 points/hour
+    data = {'flat': series(20.0, 1e6), 'rising': series(rising, 1e6)}
+    result = fleet_indicators(TIMESTAMPS, data, {'flat': 1e9, 'rising': 1e9})
+    assert result['DirtySlopePerHour'] == pytest.approx([0.0, 60.0])
+    assert result['DirtyPercent'] == pytest.approx([20.0, 65.0])
+    assert result['CacheHitPercent'] == pytest.approx([90.0, 90.0])
+
+    records = attach_indicators([{'ID': 'flat'}, {'ID': 'rising'}, {'ID': 'unknown'}], result)
+    assert [r['ID'] for r in records] == ['rising', 'flat', 'unknown']
+    assert records[2]['Risk'] is None
+    assert records[0]['DirtySlopePerHour'] == pytest.approx(60.0)
@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+from AWS_SG_MGR import AsyncStorageGatewayManager, StorageGatewayManager
+from stubs import AsyncStubClient, StubFactory, file_fleet, gateway
+
+
+def fsx_fleet():
+    client = file_fleet(gateway_count=1, nfs=2, smb=1,
+                        extra_gateways=[gateway(20, 'FILE_FSX_SMB'), gateway(21, 'FILE_FSX_SMB'),
+                                        gateway(22, 'CACHED')])
+    client.associations = {client.gateways[1]['GatewayARN']: 7, client.gateways[2]['GatewayARN']: 6}
+    client.volumes = {client.gateways[3]['GatewayARN']: 2}
+    return client
+
+
+def test_associations_are_batched_across_gateways():
+    client = fsx_fleet()
+    manager = StorageGatewayManager(factory=StubFactory(client), max_workers=4)
+    report = manager.collect_association_report(manager.get_detailed_status(shallow=True))
+
+    assert sorted(report) == ['gw20', 'gw21']
+    assert len(report['gw20']['FileSystemAssociations']) == 7
+    assert len(report['gw21']['FileSystemAssociations']) == 6
+    batches = [arns for op, arns in client.calls if op == 'describe_file_system_associations']
+    assert [len(b) for b in batches] == [10, 3]
+    assoc = report['gw20']['FileSystemAssociations'][0]
+    assert (assoc['AssociationID'], assoc['CacheStaleTimeoutSeconds'], assoc['IpAddresses']) == \
+        ('fsa-000', 300, ['10.0.0.9'])
+
+
+def test_inventory_merges_shares_associations_and_volumes():
+    manager = StorageGatewayManager(factory=StubFactory(fsx_fleet()))
+    inventory = manager.collect_inventory_report(manager.get_detailed_status(shallow=True))
+    assert len(inventory['gw0']['Shares']) == 3
+    assert inventory['gw20']['Shares'] == []
+    assert len(inventory['gw20']['FileSystemAssociations']) == 7
+    assert len(inventory['gw22']['Volumes']) == 2
+
+
+def test_incremental_refresh_includes_associations_and_volumes(tmp_path):
+    manager = StorageGatewayManager(factory=StubFactory(fsx_fleet()))
+    output, state_file = tmp_path / 'inventory.json', tmp_path / 'state.json'
+    manager.export_shares_incremental(str(output), str(state_file))
+    report = json.loads(output.read_text())
+    assert len(report['gw21']['FileSystemAssociations']) == 6
+    assert len(report['gw22']['Volumes']) == 2
+
+
+def test_async_inventory_matches_sync_inventory():
+    client = fsx_fleet()
+    expected = StorageGatewayManager(factory=StubFactory(client)).collect_inventory_report()
+
+    async def collect():
+        manager = AsyncStorageGatewayManager(max_concurrency=4)
+        manager.client = AsyncStubClient(client)
+        manager._semaphore = asyncio.Semaphore(4)
+        return await manager.collect_inventory_report()
+
+    assert asyncio.run(collect()) == expected
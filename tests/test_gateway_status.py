@@ -0,0 +1,34 @@
+import pytest
+
+from AWS_SG_MGR import StorageGatewayManager
+from stubs import StubClient, StubFactory, gateway
+
+
+@pytest.fixture
+def client():
+    return StubClient([gateway(i) for i in range(5)])
+
+
+def test_shallow_status_makes_no_describe_calls(client):
+    manager = StorageGatewayManager(factory=StubFactory(client))
+    records = manager.get_detailed_status(shallow=True)
+    assert [r['ID'] for r in records] == [f'sgw-{i:03d}' for i in range(5)]
+    assert records[0]['Status'] == 'ACTIVE'
+    assert set(client.operations()) == {'list_gateways'}
+
+
+def test_shallow_extra_fields_come_from_listing(client):
+    manager = StorageGatewayManager(factory=StubFactory(client))
+    records = manager.get_detailed_status(shallow=True, extra_fields=['SoftwareVersion'])
+    assert {r['SoftwareVersion'] for r in records} == {'2.0'}
+    assert set(client.operations()) == {'list_gateways'}
+
+
+def test_shallow_describes_only_for_fields_the_listing_lacks(client):
+    manager = StorageGatewayManager(factory=StubFactory(client), max_workers=4)
+    records = manager.get_detailed_status(shallow=True, extra_fields=['SoftwareVersion', 'GatewayTimezone'])
+    assert records[0]['SoftwareVersion'] == '2.0'
+    assert records[0]['GatewayTimezone'] == 'GMT'
+    # The core fields still come from the listing
+    assert records[0]['Status'] == 'ACTIVE'
+    assert len(client.operations('describe_gateway_information')) == 5
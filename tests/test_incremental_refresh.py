@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from AWS_SG_MGR import StorageGatewayManager
+from stubs import StubFactory, client_error, file_fleet
+
+
+@pytest.fixture
+def client():
+    return file_fleet(gateway_count=2, nfs=3, smb=1)
+
+
+@pytest.fixture
+def manager(client):
+    return StorageGatewayManager(factory=StubFactory(client))
+
+
+def share_status(report, gateway, share_id):
+    return next(s['Status'] for s in report[gateway]['Shares'] if s['ShareID'] == share_id)
+
+
+def test_unchanged_shares_are_carried_forward(client, manager):
+    first, state, counts = manager.refresh_share_report()
+    assert counts == {'Described': 8, 'CarriedForward': 0, 'Removed': 0}
+    described = len(client.operations('describe_'))
+
+    second, state, counts = manager.refresh_share_report(state)
+    assert counts == {'Described': 0, 'CarriedForward': 8, 'Removed': 0}
+    assert second == first
+    assert len(client.operations('describe_')) == described
+
+
+def test_changed_and_removed_shares(client, manager):
+    _, state, _ = manager.refresh_share_report()
+    gw0 = client.gateways[0]['GatewayARN']
+    client.share_status[f'{gw0}/nfs-1'] = 'UNAVAILABLE'
+    client.shares[gw0] = [share for share in client.shares[gw0] if share[0] != 'nfs-2']
+    client.calls.clear()
+
+    report, state, counts = manager.refresh_share_report(state)
+    assert counts == {'Described': 1, 'CarriedForward': 6, 'Removed': 1}
+    assert [arns for op, arns in client.calls if op.startswith('describe_')] == [[f'{gw0}/nfs-1']]
+    assert share_status(report, 'gw0', 'nfs-1') == 'UNAVAILABLE'
+    assert [s['ShareID'] for s in report['gw0']['Shares']] == ['nfs-0', 'nfs-1', 'smb-0']
+
+
+def test_gateway_that_fails_to_list_keeps_its_shares(client, manager):
+    first, state, _ = manager.refresh_share_report()
+    list_file_shares = client.list_file_shares
+
+    def failing(GatewayARN, Marker=None):
+        if GatewayARN == client.gateways[1]['GatewayARN']:
+            raise client_error('InternalServerError', status=400)
+        return list_file_shares(GatewayARN=GatewayARN, Marker=Marker)
+    client.list_file_shares = failing
+
+    report, _, counts = manager.refresh_share_report(state)
+    assert report == first
+    assert counts['Removed'] == 0
+    assert manager.error_count == 1
+
+
+def test_export_shares_incremental_round_trips_state(tmp_path, client, manager):
+    output, state_file = tmp_path / 'shares.json', tmp_path / 'state.json'
+    manager.export_shares_incremental(str(output), str(state_file))
+    described = len(client.operations('describe_'))
+    manager.export_shares_incremental(str(output), str(state_file))
+    assert len(client.operations('describe_')) == described
+    report = json.loads(output.read_text())
+    assert sorted(report) == ['gw0', 'gw1']
+    assert len(json.loads(state_file.read_text())['Shares']) == 8
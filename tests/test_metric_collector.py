@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from AWS_SG_MGR import MetricCollector
+from stubs import StubCloudWatch, StubFactory
+
+
+def collector(cloudwatch):
+    return MetricCollector(factory=StubFactory(cloudwatch))
+
+
+def test_queries_are_packed_500_per_call_and_pages_followed():
+    cloudwatch = StubCloudWatch(page_size=300)
+    gateway_ids = [f'sgw-{i:03d}' for i in range(130)]  # 130 gateways x 4 metrics = 520 queries
+    end = datetime(2026, 1, 1, 1, 0, tzinfo=timezone.utc)
+    timestamps, data = collector(cloudwatch).collect(gateway_ids, start=end - timedelta(hours=1), end=end)
+
+    assert cloudwatch.calls == [(500, None), (500, '300'), (20, None)]
+    assert len(data) == 130
+    assert set(data['sgw-129']) == set(MetricCollector.METRICS)
+
+
+def test_datapoints_land_on_the_shared_time_grid():
+    cloudwatch = StubCloudWatch(missing=['sgw-002'])
+    end = datetime(2026, 1, 1, 1, 0, tzinfo=timezone.utc)
+    gateways = [{'ID': 'sgw-001'}, 'sgw-002']
+    timestamps, data = collector(cloudwatch).collect(gateways, start=end - timedelta(minutes=30), end=end,
+                                                     metrics={'CachePercentDirty': 'Average'})
+    assert timestamps[0] == np.datetime64('2026-01-01T00:30:00')
+    assert len(timestamps) == 7
+    series = data['sgw-001']['CachePercentDirty']
+    assert series[:3].tolist() == [1.0, 2.0, 3.0]
+    assert np.isnan(series[3:]).all()
+    assert np.isnan(data['sgw-002']['CachePercentDirty']).all()
@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from AWS_SG_MGR import AdaptiveRateLimiter, DeadlineExceeded, MultiAccountManager
+from stubs import StubClient, StubFactory, client_error, gateway
+
+
+def make_manager(accounts, **kwargs):
+    manager = MultiAccountManager(accounts, factory=StubFactory(StubClient([gateway(0), gateway(1)])), **kwargs)
+    manager.session_for = lambda account_id: None
+    return manager
+
+
+def test_accounts_run_in_every_region():
+    manager = make_manager(['111111111111', '222222222222'], regions=['us-east-1', 'eu-west-1'])
+    status = manager.get_detailed_status(shallow=True)
+    assert sorted(status) == ['111111111111', '222222222222']
+    assert [gw['ID'] for gw in status['111111111111']['eu-west-1']] == ['sgw-000', 'sgw-001']
+    assert manager.account_stats['222222222222']['TimedOut'] is False
+
+
+def test_stuck_account_does_not_block_queued_accounts():
+    manager = make_manager(['A', 'B'], max_workers=1, account_timeout=1)
+
+    def task(mgr):
+        if mgr.account == 'A':
+            time.sleep(5)  # a call that never comes back in time
+        return mgr.get_detailed_status(shallow=True)
+
+    started = time.monotonic()
+    results = manager._fan_out(task)
+    assert time.monotonic() - started < 4
+    assert list(results) == ['B']
+    assert manager.account_stats['A']['TimedOut'] is True
+    assert manager.account_stats['B']['TimedOut'] is False
+
+
+def test_limiter_stops_retrying_at_the_deadline():
+    limiter = AdaptiveRateLimiter(base_delay=5.0, max_delay=20.0)
+
+    def throttled():
+        raise client_error('ThrottlingException')
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        limiter.call('list_gateways', throttled, deadline=time.monotonic() + 0.5)
+    assert time.monotonic() - started < 0.5
@@ -0,0 +1,22 @@
+from AWS_SG_MGR import MultiRegionManager
+from stubs import StubClient, StubFactory, gateway
+
+
+def test_status_is_keyed_by_region_and_gateway_id():
+    gateways = [gateway(i) for i in range(3)]
+    # Gateway names are not unique
+    for gw in gateways:
+        gw['GatewayName'] = 'file-gateway'
+    manager = MultiRegionManager(regions=['us-east-1', 'eu-west-1'], factory=StubFactory(StubClient(gateways)))
+    status = manager.get_detailed_status(shallow=True)
+    assert sorted(status) == ['eu-west-1', 'us-east-1']
+    assert sorted(status['us-east-1']) == ['sgw-000', 'sgw-001', 'sgw-002']
+    assert {gw['Name'] for gw in status['us-east-1'].values()} == {'file-gateway'}
+
+
+def test_region_stats_are_recorded():
+    manager = MultiRegionManager(regions=['us-east-1'], factory=StubFactory(StubClient([gateway(0)])))
+    manager.get_detailed_status(shallow=True)
+    stats = manager.region_stats['us-east-1']
+    assert stats['Errors'] == 0
+    assert stats['Api']['list_gateways']['Calls'] == 1
@@ -0,0 +1,35 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from AWS_SG_MGR import StorageGatewayManager
+from stubs import StubFactory, file_fleet
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'AWS_SG_MGR.py')
+
+
+def test_ndjson_has_gateway_then_share_records(tmp_path):
+    manager = StorageGatewayManager(factory=StubFactory(file_fleet(gateway_count=3, nfs=12, smb=1)))
+    path = tmp_path / 'shares.ndjson'
+    manager.export_shares_to_ndjson(str(path))
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+
+    assert [r['RecordType'] for r in records[:3]] == ['Gateway'] * 3
+    shares = [r for r in records if r['RecordType'] == 'Share']
+    assert len(shares) == 3 * 13
+    assert len(records) == 3 + 3 * 13
+    first = next(r for r in shares if r['Type'] == 'NFS')
+    assert (first['Gateway'], first['GatewayID'], first['AllowedClients']) == ('gw0', 'sgw-000', ['10.0.0.0/8'])
+    assert {r['ShareID'] for r in shares if r['Type'] == 'SMB'} == {'smb-0'}
+
+
+@pytest.mark.parametrize('mode', [['--ndjson'], ['--csv'], ['--parquet'], ['--sqlite', 'x.db'],
+                                  ['--incremental', 'state.json'], ['--watch']])
+def test_single_region_modes_reject_fan_out(mode, tmp_path):
+    result = subprocess.run([sys.executable, SCRIPT, *mode, '--regions', 'us-east-1', 'eu-west-1'],
+                            cwd=tmp_path, capture_output=True, text=True)
+    assert result.returncode == 2
+    assert 'only supports a single --region' in result.stderr
@@ -0,0 +1,27 @@
+import pytest
+
+from AWS_SG_MGR import StorageGatewayManager
+from stubs import StubFactory, file_fleet
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+def test_parquet_snapshot_round_trips(tmp_path):
+    manager = StorageGatewayManager(factory=StubFactory(file_fleet(gateway_count=3, nfs=4, smb=2)))
+    gateways_file, shares_file = tmp_path / 'gateways.parquet', tmp_path / 'shares.parquet'
+    manager.export_snapshot_to_parquet(str(gateways_file), str(shares_file), row_group_size=10)
+
+    gateways = pq.read_table(gateways_file)
+    assert gateways.num_rows == 3
+    assert gateways.column('ID').to_pylist() == ['sgw-000', 'sgw-001', 'sgw-002']
+
+    shares = pq.read_table(shares_file)
+    assert shares.num_rows == 18
+    assert pa.types.is_dictionary(shares.schema.field('Status').type)
+    assert pa.types.is_dictionary(shares.schema.field('Bucket').type)
+    nfs = [row for row in shares.to_pylist() if row['Type'] == 'NFS']
+    assert len(nfs) == 12
+    assert nfs[0]['AllowedClients'] == ['10.0.0.0/8']
+    # Shares are flushed in row groups instead of being held in memory
+    assert pq.ParquetFile(shares_file).num_row_groups > 1
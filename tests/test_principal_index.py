@@ -0,0 +1,32 @@
+from AWS_SG_MGR import PrincipalIndex
+
+REPORT = {
+    'gw-a': {'GatewayID': 'sgw-a', 'Shares': [
+        {'ShareID': 'share-1', 'Type': 'NFS', 'AllowedClients': ['10.0.0.0/8']},
+    ]},
+    'gw-b': {'GatewayID': 'sgw-b', 'Shares': [
+        {'ShareID': 'share-5', 'Type': 'SMB', 'AD_AllowedUsers': ['CORP\\Alice', '@Finance', 'bob@corp'],
+         'AD_AdminUsers': ['corp\\alice']},
+        {'ShareID': 'share-6', 'Type': 'SMB', 'AD_AllowedUsers': ['OTHER\\alice', '@CORP\\Finance']},
+    ]},
+    'vol-gw': {'GatewayID': 'sgw-v', 'Volumes': []},
+}
+
+
+def test_principal_normalisation():
+    assert PrincipalIndex.normalize('CORP\\Alice') == (False, 'corp\\alice', 'alice')
+    assert PrincipalIndex.normalize(' alice@CORP ') == (False, 'corp\\alice', 'alice')
+    assert PrincipalIndex.normalize('@Finance') == (True, 'finance', 'finance')
+    assert PrincipalIndex.normalize('@CORP\\Finance') == (True, 'corp\\finance', 'finance')
+
+
+def test_principal_lookups():
+    index = PrincipalIndex(REPORT)
+    assert index.shares_for_user('alice@corp') == [('gw-b', 'share-5', 'admin'), ('gw-b', 'share-5', 'valid')]
+    assert index.shares_for_user('alice', any_domain=True) == [('gw-b', 'share-5', 'admin'),
+                                                               ('gw-b', 'share-5', 'valid'),
+                                                               ('gw-b', 'share-6', 'valid')]
+    assert index.shares_for_group('finance') == [('gw-b', 'share-5', 'valid')]
+    assert index.shares_for_group('@finance', any_domain=True) == [('gw-b', 'share-5', 'valid'),
+                                                                   ('gw-b', 'share-6', 'valid')]
+    assert index.shares_for_leavers(['CORP\\bob', 'carol']) == {'CORP\\bob': [('gw-b', 'share-5', 'valid')]}
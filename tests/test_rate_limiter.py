@@ -0,0 +1,82 @@
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from AWS_SG_MGR import AdaptiveRateLimiter, ClientFactory
+from stubs import client_error
+
+
+def flaky(*errors, response=None):
+    """Returns a callable that raises each error in turn, then returns response."""
+    errors = list(errors)
+
+    def call(**kwargs):
+        if errors:
+            raise errors.pop(0)
+        return response or {'ResponseMetadata': {'RetryAttempts': 0}}
+    return call
+
+
+@pytest.fixture
+def limiter():
+    return AdaptiveRateLimiter(initial_rate=100.0, max_rate=200.0, increase=1.0, decrease=0.5, base_delay=0.001)
+
+
+def test_throttles_are_retried_and_cut_the_rate(limiter):
+    func = flaky(client_error('ThrottlingException'), client_error('ThrottlingException'))
+    limiter.call('list_gateways', func)
+    stats = limiter.stats()['list_gateways']
+    assert (stats['Calls'], stats['Throttles'], stats['Retries']) == (3, 2, 2)
+    # Two halvings, then one additive increase for the success
+    assert stats['Rate'] == pytest.approx(26.0)
+
+
+def test_transient_errors_are_retried_without_slowing_down(limiter):
+    func = flaky(EndpointConnectionError(endpoint_url='https://example'),
+                 client_error('InternalServerError', status=500))
+    limiter.call('list_gateways', func)
+    stats = limiter.stats()['list_gateways']
+    assert (stats['Calls'], stats['Throttles'], stats['Retries']) == (3, 0, 2)
+    assert stats['Rate'] == pytest.approx(101.0)
+
+
+def test_other_errors_are_raised_at_once(limiter):
+    with pytest.raises(ClientError):
+        limiter.call('describe_gateway_information', flaky(client_error('InvalidGatewayRequestException')))
+    assert limiter.stats()['describe_gateway_information']['Calls'] == 1
+
+
+def test_retries_give_up_after_max_retries():
+    limiter = AdaptiveRateLimiter(max_retries=2, base_delay=0.001)
+    with pytest.raises(ClientError):
+        limiter.call('list_gateways', flaky(*[client_error('ThrottlingException')] * 5))
+    assert limiter.stats()['list_gateways']['Calls'] == 3
+
+
+def test_botocore_retry_attempts_are_not_throttles(limiter):
+    limiter.call('list_gateways', flaky(response={'ResponseMetadata': {'RetryAttempts': 3}}))
+    assert limiter.stats()['list_gateways']['Throttles'] == 0
+
+
+def test_effective_rate_uses_a_recent_window(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('AWS_SG_MGR.time.monotonic', lambda: clock[0])
+    limiter = AdaptiveRateLimiter(initial_rate=1000.0, max_rate=1000.0, window=10.0)
+    for _ in range(20):
+        limiter.call('list_gateways', flaky())
+    clock[0] += 5.0
+    # A limiter younger than the window is measured over its own age
+    assert limiter.stats()['list_gateways']['EffectiveRate'] == pytest.approx(4.0)
+    clock[0] += 5.0
+    assert limiter.stats()['list_gateways']['EffectiveRate'] == pytest.approx(2.0)
+    # Once the burst falls out of the window the rate drops to zero, however long the limiter has lived
+    clock[0] += 60.0
+    assert limiter.stats()['list_gateways']['EffectiveRate'] == 0.0
+
+
+def test_limited_clients_have_botocore_retries_off():
+    factory = ClientFactory()
+    limited = factory.get_client('storagegateway', 'us-east-1', max_attempts=0)
+    default = factory.get_client('storagegateway', 'us-east-1')
+    assert limited is not default
+    assert limited.meta.config.retries['total_max_attempts'] == 1
+    assert default.meta.config.retries['total_max_attempts'] == 6
@@ -0,0 +1,115 @@
+import pytest
+
+from AWS_SG_MGR import DiskCacheBackend, MemoryCacheBackend, ResponseCache, StorageGatewayManager
+from stubs import StubClient, StubFactory, gateway
+
+SCOPE = ('111122223333', 'us-east-1')
+ARN = 'arn:aws:storagegateway:us-east-1:111122223333:gateway/sgw-000'
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('AWS_SG_MGR.time.time', clock)
+    return clock
+
+
+def counter():
+    """A fetch function that returns how many times it has been called."""
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return {'Version': len(calls), 'GatewayARN': ARN}
+    return fetch, calls
+
+
+def test_fresh_entries_are_served_from_cache(clock):
+    cache = ResponseCache(ttls={'op': 10})
+    fetch, calls = counter()
+    assert cache.get_or_fetch(SCOPE, 'op', {'GatewayARN': ARN}, fetch)['Version'] == 1
+    clock.now += 5
+    assert cache.get_or_fetch(SCOPE, 'op', {'GatewayARN': ARN}, fetch)['Version'] == 1
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_stale_entries_are_served_while_one_refresh_runs(clock):
+    cache = ResponseCache(ttls={'op': 10}, stale_ttl=20)
+    fetch, calls = counter()
+    cache.get_or_fetch(SCOPE, 'op', {}, fetch)
+    clock.now += 15
+    assert cache.get_or_fetch(SCOPE, 'op', {}, fetch)['Version'] == 1
+    cache._refresher.shutdown(wait=True)
+    assert cache.stale_hits == 1
+    # The background refresh replaced the entry
+    assert cache.get_or_fetch(SCOPE, 'op', {}, fetch)['Version'] == 2
+    assert len(calls) == 2
+
+
+def test_expired_entries_are_fetched_again(clock):
+    cache = ResponseCache(ttls={'op': 10}, stale_ttl=20)
+    fetch, calls = counter()
+    cache.get_or_fetch(SCOPE, 'op', {}, fetch)
+    clock.now += 31
+    assert cache.get_or_fetch(SCOPE, 'op', {}, fetch)['Version'] == 2
+    assert cache.misses == 2
+
+
+def test_operations_without_a_ttl_are_not_cached(clock):
+    cache = ResponseCache()
+    fetch, calls = counter()
+    cache.get_or_fetch(SCOPE, 'update_gateway_information', {}, fetch)
+    cache.get_or_fetch(SCOPE, 'update_gateway_information', {}, fetch)
+    assert len(calls) == 2
+    assert cache.backend.items() == []
+
+
+def test_invalidate_gateway_drops_tagged_entries(clock):
+    cache = ResponseCache(ttls={'op': 10})
+    fetch, calls = counter()
+    cache.get_or_fetch(SCOPE, 'op', {'FileShareARNList': ['x']}, fetch)  # tagged through the response
+    cache.get_or_fetch(SCOPE, 'op', {'GatewayARN': 'other'}, lambda: {})
+    assert cache.invalidate_gateway(ARN) == 1
+    assert len(cache.backend.items()) == 1
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(max_entries=2)
+    backend.set('a', 1)
+    backend.set('b', 2)
+    backend.get('a')
+    backend.set('c', 3)
+    assert [key for key, _ in backend.items()] == ['a', 'c']
+
+
+def test_disk_backend_survives_reopening(tmp_path, clock):
+    path = str(tmp_path / 'cache')
+    cache = ResponseCache(backend=DiskCacheBackend(path), ttls={'op': 10})
+    fetch, calls = counter()
+    cache.get_or_fetch(SCOPE, 'op', {}, fetch)
+    cache.backend.close()
+    cache = ResponseCache(backend=DiskCacheBackend(path), ttls={'op': 10})
+    assert cache.get_or_fetch(SCOPE, 'op', {}, fetch)['Version'] == 1
+    assert len(calls) == 1
+    cache.backend.close()
+
+
+def test_manager_reuses_cached_share_describes():
+    gateways = [gateway(0), gateway(1)]
+    client = StubClient(gateways, {gw['GatewayARN']: [('nfs-0', 'NFS'), ('smb-0', 'SMB')] for gw in gateways})
+    manager = StorageGatewayManager(factory=StubFactory(client), cache=ResponseCache())
+    first = manager.collect_share_report(manager.get_detailed_status(shallow=True))
+    calls = len(client.calls)
+    second = manager.collect_share_report(manager.get_detailed_status(shallow=True))
+    assert second == first
+    # Only list_gateways is uncached
+    assert client.operations()[calls:] == ['list_gateways']
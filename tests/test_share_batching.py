@@ -0,0 +1,46 @@
+import pytest
+
+from AWS_SG_MGR import StorageGatewayManager
+from stubs import StubClient, StubFactory, gateway
+
+
+@pytest.fixture
+def fleet():
+    gateways = [gateway(i) for i in range(5)] + [gateway(5, 'CACHED')]
+    # 7 NFS + 2 SMB shares per file gateway: 35 NFS and 10 SMB in total
+    shares = {gw['GatewayARN']: [(f'nfs-{i}', 'NFS') for i in range(7)] + [(f'smb-{i}', 'SMB') for i in range(2)]
+              for gw in gateways[:5]}
+    client = StubClient(gateways, shares)
+    return client, StorageGatewayManager(factory=StubFactory(client), max_workers=4)
+
+
+def test_list_gateways_follows_marker(fleet):
+    client, manager = fleet
+    assert [gw['GatewayId'] for gw in manager.list_all_gateways()] == [f'sgw-{i:03d}' for i in range(6)]
+    assert [marker for op, marker in client.calls] == [None, '2', '4']
+
+
+def test_list_file_shares_follows_next_marker(fleet):
+    client, manager = fleet
+    shares = manager._list_gateway_shares(client.gateways[0]['GatewayARN'])
+    assert len(shares) == 9
+    # Following the echoed Marker instead of NextMarker would loop on the first page
+    assert [marker for op, marker in client.calls] == [None, '2', '4', '6', '8']
+
+
+def test_share_describes_are_pooled_across_gateways(fleet):
+    client, manager = fleet
+    report = manager.collect_share_report(manager.get_detailed_status(shallow=True))
+
+    nfs = [arns for op, arns in client.calls if op == 'describe_nfs_file_shares']
+    smb = [arns for op, arns in client.calls if op == 'describe_smb_file_shares']
+    # 35 NFS shares from five gateways fill four calls, not five half-empty ones
+    assert [len(b) for b in nfs] == [10, 10, 10, 5]
+    assert [len(b) for b in smb] == [10]
+    assert len({arn.rsplit('/', 1)[0] for arn in nfs[0]}) > 1
+
+    assert sorted(report) == [f'gw{i}' for i in range(5)]
+    shares = report['gw2']['Shares']
+    assert [s['ShareID'] for s in shares] == [f'nfs-{i}' for i in range(7)] + ['smb-0', 'smb-1']
+    assert shares[0]['AllowedClients'] == ['10.0.0.0/8']
+    assert shares[-1]['AD_AllowedGroups'] == ['@Staff']
@@ -0,0 +1,58 @@
+import pytest
+
+from AWS_SG_MGR import SnapshotStore
+
+
+def gateways(status='RUNNING'):
+    return [{'ID': 'sgw-1', 'Name': 'gw1', 'Status': status, 'Type': 'FILE_S3', 'ARN': 'arn:sgw-1'},
+            {'ID': 'sgw-2', 'Name': 'gw2', 'Status': 'RUNNING', 'Type': 'FILE_S3', 'ARN': 'arn:sgw-2'}]
+
+
+def report(bucket='arn:aws:s3:::data'):
+    return {
+        'gw1': {'GatewayID': 'sgw-1', 'Shares': [
+            {'ShareID': 'share-1', 'Type': 'NFS', 'Path': '/a', 'Bucket': bucket, 'Status': 'AVAILABLE',
+             'AllowedClients': ['10.0.0.0/8']}]},
+        'gw2': {'GatewayID': 'sgw-2', 'Shares': [
+            {'ShareID': 'share-1', 'Type': 'SMB', 'Path': '/b', 'Bucket': 'arn:aws:s3:::other',
+             'Status': 'AVAILABLE', 'AD_AllowedUsers': ['@Staff', 'CORP\\Bob'], 'AD_AdminUsers': ['CORP\\Admin'],
+             'SMB_ACL_Enabled': True}]},
+        'vol': {'GatewayID': 'sgw-3', 'Volumes': [{'VolumeID': 'vol-1'}]},
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'inventory.db'))
+    yield store
+    store.close()
+
+
+def test_write_run_and_query_latest(store):
+    store.write_run(gateways(), report('arn:aws:s3:::old'), account='111', region='us-east-1', taken_at=100)
+    run_id = store.write_run(gateways(), report(), account='111', region='us-east-1', taken_at=200)
+    assert store.latest_run('111', 'us-east-1') == run_id
+    assert store.shares_using_bucket('arn:aws:s3:::data') == [('sgw-1', 'share-1', 'NFS', '/a')]
+    # Share IDs only need to be unique per gateway
+    assert store.conn.execute("SELECT COUNT(*) FROM shares WHERE run_id = ?", [run_id]).fetchone()[0] == 2
+    assert sorted(store.shares_for_principal('corp\\bob')) == [('share-1', 'valid')]
+
+
+def test_queries_are_scoped_by_account_and_region(store):
+    store.write_run(gateways(), report(), account='111', region='us-east-1', taken_at=100)
+    store.write_run(gateways(), report('arn:aws:s3:::eu'), account='111', region='eu-west-1', taken_at=200)
+    # A newer run in another region doesn't hide this region's latest run
+    assert store.shares_using_bucket('arn:aws:s3:::data', scope=('111', 'us-east-1')) == \
+        [('sgw-1', 'share-1', 'NFS', '/a')]
+    assert store.shares_using_bucket('arn:aws:s3:::data', scope=('111', 'eu-west-1')) == []
+    assert len(store.shares_using_bucket('arn:aws:s3:::data')) == 1
+    assert sorted(store.scopes()) == [('111', 'eu-west-1'), ('111', 'us-east-1')]
+
+
+def test_status_changes_compare_runs_within_a_scope(store):
+    store.write_run(gateways(), report(), account='111', region='us-east-1', taken_at=100)
+    store.write_run(gateways(), report(), account='111', region='eu-west-1', taken_at=150)
+    store.write_run(gateways('OFFLINE'), report(), account='111', region='us-east-1', taken_at=200)
+    store.write_run(gateways(), report(), account='111', region='eu-west-1', taken_at=250)
+    assert store.status_changes(since=120) == [('sgw-1', 'gw1', 'RUNNING', 'OFFLINE')]
+    assert store.status_changes(since=120, to_status='OFFLINE', scope=('111', 'eu-west-1')) == []
@@ -0,0 +1,39 @@
+import json
+
+from AWS_SG_MGR import StorageGatewayManager
+from stubs import StubClient, StubFactory, gateway
+
+
+def tape_fleet():
+    client = StubClient([gateway(0, 'VTL'), gateway(1, 'VTL')], page_size=60)
+    client.tapes = {client.gateways[0]['GatewayARN']: 75, client.gateways[1]['GatewayARN']: 5}
+    client.archived_tapes = 3
+    return client
+
+
+def test_tapes_are_streamed_and_described_in_batches():
+    client = tape_fleet()
+    manager = StorageGatewayManager(factory=StubFactory(client), max_workers=4)
+    records = list(manager.iter_tape_records())
+
+    assert len(records) == 83
+    active = [r for r in records if not r['Archived']]
+    assert {r['Gateway'] for r in active} == {'gw0', 'gw1'}
+    assert active[0]['VTLDevice'] == 'dev-0'
+    archived = [r for r in records if r['Archived']]
+    assert [r['Barcode'] for r in archived] == ['ARCH000', 'ARCH001', 'ARCH002']
+    assert archived[0]['GatewayID'] is None
+    # Page 1 holds 60 of gw0's tapes; page 2 the other 15 plus gw1's 5. Batches are per gateway.
+    batches = [len(arns) for op, arns in client.calls if op == 'describe_tapes']
+    assert sorted(batches) == [5, 10, 15, 50]
+    assert len(client.operations('list_tapes')) == 2
+
+
+def test_archive_can_be_skipped(tmp_path):
+    client = tape_fleet()
+    manager = StorageGatewayManager(factory=StubFactory(client))
+    path = tmp_path / 'tapes.ndjson'
+    manager.export_tapes_to_ndjson(str(path), include_archive=False)
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 80
+    assert 'describe_tape_archives' not in client.operations()
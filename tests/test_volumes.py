@@ -0,0 +1,44 @@
+import json
+
+from AWS_SG_MGR import StorageGatewayManager
+from stubs import StubFactory, file_fleet, gateway
+
+
+def volume_fleet():
+    client = file_fleet(gateway_count=1, nfs=1, smb=0,
+                        extra_gateways=[gateway(10, 'CACHED'), gateway(11, 'STORED'), gateway(12, 'CACHED')])
+    client.volumes = {client.gateways[1]['GatewayARN']: 23, client.gateways[2]['GatewayARN']: 3}
+    return client
+
+
+def test_volumes_are_described_in_batches_per_gateway():
+    client = volume_fleet()
+    manager = StorageGatewayManager(factory=StubFactory(client), max_workers=4)
+    report = manager.collect_volume_report(manager.get_detailed_status(shallow=True))
+
+    assert sorted(report) == ['gw10', 'gw11', 'gw12']
+    assert len(report['gw10']['Volumes']) == 23
+    assert report['gw12']['Volumes'] == []
+    cached = [arns for op, arns in client.calls if op == 'describe_cached_iscsi_volumes']
+    assert sorted(len(b) for b in cached) == [3, 10, 10]
+    # Batches never mix gateways
+    assert all(len({arn.split('/volume/')[0] for arn in batch}) == 1 for batch in cached)
+
+    stored = report['gw11']['Volumes'][0]
+    assert (stored['Type'], stored['DiskId'], stored['TargetARN']) == \
+        ('STORED', 'disk-0', client.gateways[2]['GatewayARN'] + '/volume/vol-000/target')
+    assert 'DiskId' not in report['gw10']['Volumes'][0]
+
+
+def test_inventory_and_ndjson_include_volumes(tmp_path):
+    client = volume_fleet()
+    manager = StorageGatewayManager(factory=StubFactory(client))
+    inventory = manager.collect_inventory_report()
+    assert len(inventory['gw0']['Shares']) == 1
+    assert len(inventory['gw11']['Volumes']) == 3
+
+    path = tmp_path / 'inventory.ndjson'
+    manager.export_shares_to_ndjson(str(path))
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert sum(r['RecordType'] == 'Volume' for r in records) == 26
+    assert sum(r['RecordType'] == 'Gateway' for r in records) == 4
@@ -0,0 +1,89 @@
+import json
+import threading
+
+import pytest
+
+from AWS_SG_MGR import AnomalyDetector, GatewayWatcher, MetricCollector, StorageGatewayManager
+from stubs import StubCloudWatch, StubFactory, file_fleet
+
+
+@pytest.fixture
+def client():
+    return file_fleet(gateway_count=2, nfs=2, smb=1)
+
+
+@pytest.fixture
+def watcher(client, tmp_path):
+    manager = StorageGatewayManager(factory=StubFactory(client))
+    return GatewayWatcher(manager, output=str(tmp_path / 'shares.json'), events_file=str(tmp_path / 'events.ndjson'))
+
+
+def events(watcher):
+    with open(watcher.events_file) as f:
+        return [json.loads(line) for line in f]
+
+
+def share_status(report, gateway, share_id):
+    return next(s['Status'] for s in report[gateway]['Shares'] if s['ShareID'] == share_id)
+
+
+def test_watcher_installs_a_response_cache(watcher):
+    assert watcher.manager.cache is not None
+
+
+def test_changed_share_is_described_fresh_despite_the_cache(tmp_path):
+    client = file_fleet(gateway_count=1, nfs=1, smb=0)
+    manager = StorageGatewayManager(factory=StubFactory(client))
+    watcher = GatewayWatcher(manager, output=str(tmp_path / 'shares.json'), events_file=str(tmp_path / 'events.ndjson'))
+    watcher.poll_shares()
+    # A full report on the same manager caches the describe for exactly the batch that changes next
+    manager.collect_share_report()
+    client.share_status[f"{client.gateways[0]['GatewayARN']}/nfs-0"] = 'UNAVAILABLE'
+
+    watcher.poll_shares()
+    assert share_status(watcher.share_report, 'gw0', 'nfs-0') == 'UNAVAILABLE'
+    # Later refreshes carry the new details forward instead of the stale ones
+    watcher.poll_shares()
+    assert share_status(watcher.share_report, 'gw0', 'nfs-0') == 'UNAVAILABLE'
+    with open(watcher.output) as f:
+        assert share_status(json.load(f), 'gw0', 'nfs-0') == 'UNAVAILABLE'
+    assert [(e['Event'], e['ShareID'], e['To']) for e in events(watcher)] == \
+        [('ShareStatusChanged', 'nfs-0', 'UNAVAILABLE')]
+
+
+def cached_for(manager, gateway_arn):
+    return [key for key, (_, _, tags) in manager.cache.backend.items() if gateway_arn in tags]
+
+
+def test_state_change_emits_an_event_and_drops_cached_responses(client, watcher):
+    watcher.poll_status()
+    watcher.manager.collect_share_report()
+    gw0, gw1 = (gw['GatewayARN'] for gw in client.gateways)
+    assert cached_for(watcher.manager, gw0) and cached_for(watcher.manager, gw1)
+
+    client.gateways[0]['GatewayOperationalState'] = 'DISABLED'
+    watcher.poll_status()
+    assert [(e['Event'], e['GatewayID'], e['To']) for e in events(watcher)] == \
+        [('GatewayStateChanged', 'sgw-000', 'DISABLED')]
+    assert not cached_for(watcher.manager, gw0)
+    assert cached_for(watcher.manager, gw1)
+
+
+def test_poll_metrics_feeds_the_detector(watcher):
+    watcher.collector = MetricCollector(factory=StubFactory(StubCloudWatch()))
+    watcher.detector = AnomalyDetector(warmup=100)
+    watcher.poll_metrics()
+    watcher.poll_metrics()
+    # Each of the three datapoints per series is absorbed once, however often it is collected
+    assert watcher.detector.count[watcher.detector.rows['sgw-000'], 0] == 3
+
+
+def test_run_schedules_tasks_until_stopped(watcher, monkeypatch):
+    monkeypatch.setattr('AWS_SG_MGR.signal.signal', lambda *args: None)
+    watcher.intervals = {'status': 0.05, 'shares': 0.2, 'metrics': 0}
+    runs = {'status': 0, 'shares': 0}
+    monkeypatch.setattr(watcher, 'poll_status', lambda: runs.__setitem__('status', runs['status'] + 1))
+    monkeypatch.setattr(watcher, 'poll_shares', lambda: runs.__setitem__('shares', runs['shares'] + 1))
+    threading.Timer(0.5, watcher.stop_event.set).start()
+    watcher.run()
+    assert runs['status'] > runs['shares'] >= 1